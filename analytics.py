@@ -0,0 +1,292 @@
+"""Incrementally maintained impact rollups.
+
+Every write in the app adds its numbers to running sums keyed by the
+dimension it is reported on: farmer price by crop and district, transit time
+and cold-chain compliance by route, fertilizer use by district, and retail
+allocation against retail sales by retailer. Reading a metric is a dict
+lookup and a division, however many records have been written.
+``Rollups.backfill`` rebuilds the same tables from DataFrames with vectorized
+group-bys, for loading a season of history in one go.
+
+    python analytics.py --sales 200000
+"""
+import argparse
+import threading
+import time
+from collections import defaultdict
+
+import numpy as np
+import pandas as pd
+
+from transport_simulator import SAFE_MAX_TEMP
+
+
+def _ratio(numerator, denominator):
+    return numerator / denominator if denominator else None
+
+
+class Rollups:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._reset()
+
+    def _reset(self):
+        # [price * kg, kg, sales] by (crop, district), and by crop alone
+        self._prices = defaultdict(lambda: [0.0, 0.0, 0])
+        self._crop_prices = defaultdict(lambda: [0.0, 0.0, 0])
+        # [shipments, transit hours, compliant shipments] by (from, to), counting each shipment once
+        self._routes = defaultdict(lambda: [0, 0.0, 0])
+        self._shipments = set()
+        # [fertilizer kg, acres of farms that applied it] by district
+        self._fertilizer = defaultdict(lambda: [0.0, 0.0])
+        self._farms = {}
+        self._fertilized = set()
+        # [allocated kg, sold kg] by retailer, plus the overall totals
+        self._retailers = defaultdict(lambda: [0.0, 0.0])
+        self._retail_totals = [0.0, 0.0]
+
+    # Writes: each is a handful of additions under the lock
+
+    def record_farm(self, farmer_id, district, acres):
+        with self._lock:
+            self._farms[farmer_id] = (district, float(acres))
+
+    def record_sale(self, crop, district, price_per_kg, quantity_kg):
+        with self._lock:
+            for agg in (self._prices[(crop, district)], self._crop_prices[crop]):
+                agg[0] += price_per_kg * quantity_kg
+                agg[1] += quantity_kg
+                agg[2] += 1
+
+    def record_fertilizer(self, farmer_id, quantity_kg):
+        with self._lock:
+            farm = self._farms.get(farmer_id)
+            if farm is None:
+                return
+            district, acres = farm
+            agg = self._fertilizer[district]
+            agg[0] += quantity_kg
+            if farmer_id not in self._fertilized:
+                # A farm's acreage counts once, however many applications it records
+                self._fertilized.add(farmer_id)
+                agg[1] += acres
+
+    def record_shipment(self, shipment_id, origin, destination, transit_hours, max_temp, threshold=SAFE_MAX_TEMP):
+        # Re-recording a completed shipment is a no-op; returns whether it was counted
+        with self._lock:
+            if shipment_id in self._shipments:
+                return False
+            self._shipments.add(shipment_id)
+            agg = self._routes[(origin, destination)]
+            agg[0] += 1
+            agg[1] += transit_hours
+            agg[2] += max_temp <= threshold
+            return True
+
+    def record_allocation(self, retailer, quantity_kg):
+        with self._lock:
+            self._retailers[retailer][0] += quantity_kg
+            self._retail_totals[0] += quantity_kg
+
+    def record_retail_sale(self, retailer, quantity_kg):
+        # Raises ValueError rather than let a retailer sell more than it was allocated
+        with self._lock:
+            allocated, sold = self._retailers.get(retailer, (0.0, 0.0))
+            if quantity_kg > allocated - sold:
+                raise ValueError(f"{retailer} has only {allocated - sold:g}kg allocated and unsold")
+            self._retailers[retailer][1] += quantity_kg
+            self._retail_totals[1] += quantity_kg
+
+    # Reads: constant time per metric
+
+    def farmer_price(self, crop, district=None):
+        # Quantity-weighted average price per kg, or None without sales
+        agg = self._crop_prices.get(crop) if district is None else self._prices.get((crop, district))
+        return _ratio(agg[0], agg[1]) if agg else None
+
+    def route(self, origin, destination):
+        agg = self._routes.get((origin, destination))
+        if not agg:
+            return None
+        return {
+            "Shipments": agg[0],
+            "AvgTransitHours": agg[1] / agg[0],
+            "CompliancePct": 100.0 * agg[2] / agg[0],
+        }
+
+    def fertilizer_intensity(self, district):
+        # Fertilizer kg applied per acre of the district's fertilized farms
+        agg = self._fertilizer.get(district)
+        return _ratio(agg[0], agg[1]) if agg else None
+
+    def sell_through(self, retailer=None):
+        # Percent of allocated kg sold at retail, overall or for one retailer
+        allocated, sold = self._retail_totals if retailer is None else self._retailers.get(retailer, (0, 0))
+        ratio = _ratio(sold, allocated)
+        return None if ratio is None else 100.0 * ratio
+
+    def tables(self):
+        """Every rollup as a display-ready DataFrame; one row per group."""
+        with self._lock:
+            prices = [(c, d, a[0] / a[1], a[1], a[2]) for (c, d), a in self._prices.items() if a[1]]
+            routes = [(o, d, a[0], a[1] / a[0], 100.0 * a[2] / a[0]) for (o, d), a in self._routes.items()]
+            fertilizer = [(d, a[0], a[1], _ratio(a[0], a[1])) for d, a in self._fertilizer.items()]
+            retailers = [(r, a[0], a[1], 100.0 * _ratio(a[1], a[0]) if a[0] else None)
+                         for r, a in self._retailers.items()]
+        return {
+            "prices": pd.DataFrame(prices, columns=["Crop", "District", "AvgPricePerKg", "QuantityKg", "Sales"]),
+            "routes": pd.DataFrame(routes, columns=["From", "To", "Shipments", "AvgTransitHours", "CompliancePct"]),
+            "fertilizer": pd.DataFrame(fertilizer, columns=["District", "FertilizerKg", "Acres", "KgPerAcre"]),
+            "retailers": pd.DataFrame(retailers, columns=["Retailer", "AllocatedKg", "SoldKg", "SellThroughPct"]),
+        }
+
+    def backfill(self, farms=None, sales=None, applications=None, shipments=None, allocations=None,
+                 retail_sales=None, threshold=SAFE_MAX_TEMP):
+        """Replace every rollup with one computed from full history.
+
+        Frames use the keyword names of the matching ``record_*`` method as
+        columns (``farmer_id``, ``district``, ``acres``; ``crop``,
+        ``price_per_kg``, ``quantity_kg``; ``shipment_id``, ``origin``,
+        ``destination``, ``transit_hours``, ``max_temp``; ``retailer``).
+        Omitted frames are treated as empty.
+        """
+        empty = pd.DataFrame
+        farms = empty(columns=["farmer_id", "district", "acres"]) if farms is None else farms
+        sales = empty(columns=["crop", "district", "price_per_kg", "quantity_kg"]) if sales is None else sales
+        applications = empty(columns=["farmer_id", "quantity_kg"]) if applications is None else applications
+        shipments = (empty(columns=["shipment_id", "origin", "destination", "transit_hours", "max_temp"])
+                     if shipments is None else shipments).drop_duplicates("shipment_id")
+        allocations = empty(columns=["retailer", "quantity_kg"]) if allocations is None else allocations
+        retail_sales = empty(columns=["retailer", "quantity_kg"]) if retail_sales is None else retail_sales
+
+        sales = sales.assign(revenue=sales["price_per_kg"] * sales["quantity_kg"])
+        by_district = sales.groupby(["crop", "district"])[["revenue", "quantity_kg"]].sum()
+        by_district["sales"] = sales.groupby(["crop", "district"]).size()
+        by_crop = sales.groupby("crop")[["revenue", "quantity_kg"]].sum()
+        by_crop["sales"] = sales.groupby("crop").size()
+
+        routes = shipments.assign(compliant=shipments["max_temp"] <= threshold).groupby(["origin", "destination"]).agg(
+            shipments=("transit_hours", "size"), hours=("transit_hours", "sum"), compliant=("compliant", "sum"))
+
+        farms = farms.drop_duplicates("farmer_id", keep="last").set_index("farmer_id")
+        applied = applications.groupby("farmer_id")["quantity_kg"].sum()
+        applied = farms.join(applied, how="inner")
+        fertilizer = applied.groupby("district")[["quantity_kg", "acres"]].sum()
+
+        retailers = pd.DataFrame({
+            "allocated": allocations.groupby("retailer")["quantity_kg"].sum(),
+            "sold": retail_sales.groupby("retailer")["quantity_kg"].sum(),
+        }).fillna(0.0)
+
+        with self._lock:
+            self._reset()
+            for key, row in zip(by_district.index, by_district.itertuples(index=False)):
+                self._prices[key] = [float(row.revenue), float(row.quantity_kg), int(row.sales)]
+            for key, row in zip(by_crop.index, by_crop.itertuples(index=False)):
+                self._crop_prices[key] = [float(row.revenue), float(row.quantity_kg), int(row.sales)]
+            for key, row in zip(routes.index, routes.itertuples(index=False)):
+                self._routes[key] = [int(row.shipments), float(row.hours), int(row.compliant)]
+            self._shipments = set(shipments["shipment_id"])
+            self._farms = {f: (d, float(a)) for f, d, a in zip(farms.index, farms["district"], farms["acres"])}
+            self._fertilized = set(applied.index)
+            for district, row in zip(fertilizer.index, fertilizer.itertuples(index=False)):
+                self._fertilizer[district] = [float(row.quantity_kg), float(row.acres)]
+            for retailer, row in zip(retailers.index, retailers.itertuples(index=False)):
+                self._retailers[retailer] = [float(row.allocated), float(row.sold)]
+            self._retail_totals = [float(retailers["allocated"].sum()), float(retailers["sold"].sum())]
+
+
+def _synthetic_season(n_sales, seed=11):
+    # A season of records for every rollup, roughly one shipment per sale
+    rng = np.random.default_rng(seed)
+    crops = np.array(["Sharbati Wheat", "Basmati Rice", "Organic Apple", "Rajma"])
+    districts = np.array(["Uttarkashi", "Dehradun", "Tehri", "Chamoli", "Pauri", "Almora", "Nainital"])
+    villages = np.array(["Harsill", "Mori", "Purola", "Barkot", "Chinyalisaur"])
+    retailers = np.array(["FreshMart", "Organic Bazaar", "Farm2Table"])
+    n_farms = max(n_sales // 4, 1)
+    farms = pd.DataFrame({
+        "farmer_id": [f"FARM{n}" for n in range(n_farms)],
+        "district": rng.choice(districts, n_farms),
+        "acres": rng.uniform(0.5, 10.0, n_farms).round(1),
+    })
+    quantity = rng.integers(100, 2000, n_sales).astype(float)
+    frames = {
+        "farms": farms,
+        "sales": pd.DataFrame({
+            "crop": rng.choice(crops, n_sales),
+            "district": rng.choice(districts, n_sales),
+            "price_per_kg": rng.integers(18, 40, n_sales).astype(float),
+            "quantity_kg": quantity,
+        }),
+        "applications": pd.DataFrame({
+            "farmer_id": farms["farmer_id"].to_numpy()[rng.integers(0, n_farms, n_sales)],
+            "quantity_kg": rng.integers(10, 200, n_sales).astype(float),
+        }),
+        "shipments": pd.DataFrame({
+            "shipment_id": [f"SHIP{n}" for n in range(n_sales)],
+            "origin": rng.choice(villages, n_sales),
+            "destination": rng.choice(np.array(["Mumbai", "Delhi", "Pune"]), n_sales),
+            "transit_hours": rng.uniform(12.0, 60.0, n_sales),
+            "max_temp": rng.normal(4.2, 0.6, n_sales),
+        }),
+        "allocations": pd.DataFrame({"retailer": rng.choice(retailers, n_sales), "quantity_kg": quantity}),
+        "retail_sales": pd.DataFrame({
+            "retailer": rng.choice(retailers, n_sales),
+            "quantity_kg": (quantity * rng.uniform(0.5, 1.0, n_sales)).round(),
+        }),
+    }
+    return frames
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark incremental rollups against a vectorized backfill")
+    parser.add_argument("--sales", type=int, default=200000, help="sales (and shipments) in the season")
+    args = parser.parse_args(argv)
+
+    frames = _synthetic_season(args.sales)
+    incremental = Rollups()
+    started = time.perf_counter()
+    for row in frames["farms"].itertuples(index=False):
+        incremental.record_farm(row.farmer_id, row.district, row.acres)
+    for row in frames["sales"].itertuples(index=False):
+        incremental.record_sale(row.crop, row.district, row.price_per_kg, row.quantity_kg)
+    for row in frames["applications"].itertuples(index=False):
+        incremental.record_fertilizer(row.farmer_id, row.quantity_kg)
+    for row in frames["shipments"].itertuples(index=False):
+        incremental.record_shipment(row.shipment_id, row.origin, row.destination, row.transit_hours, row.max_temp)
+    for row in frames["allocations"].itertuples(index=False):
+        incremental.record_allocation(row.retailer, row.quantity_kg)
+    for row in frames["retail_sales"].itertuples(index=False):
+        incremental.record_retail_sale(row.retailer, row.quantity_kg)
+    elapsed = time.perf_counter() - started
+    writes = sum(len(frame) for frame in frames.values())
+    print(f"incremental: {writes:,} writes in {elapsed:.2f}s, {elapsed / writes * 1e6:.1f} µs per write")
+
+    backfilled = Rollups()
+    started = time.perf_counter()
+    backfilled.backfill(**frames)
+    print(f"vectorized backfill: {(time.perf_counter() - started) * 1000:.0f} ms")
+
+    started = time.perf_counter()
+    for _ in range(1000):
+        backfilled.farmer_price("Sharbati Wheat", "Uttarkashi")
+        backfilled.route("Harsill", "Mumbai")
+        backfilled.fertilizer_intensity("Uttarkashi")
+        backfilled.sell_through()
+    print(f"dashboard metrics: {(time.perf_counter() - started) * 1000:.3f} µs per read of all four")
+    started = time.perf_counter()
+    tables = backfilled.tables()
+    print(f"full rollup tables: {(time.perf_counter() - started) * 1000:.1f} ms, "
+          f"{sum(len(t) for t in tables.values())} rows")
+
+    ours, theirs = incremental.tables(), tables
+    for name in ours:
+        key = list(ours[name].columns[:2 if name in ("prices", "routes") else 1])
+        a = ours[name].sort_values(key).reset_index(drop=True)
+        b = theirs[name].sort_values(key).reset_index(drop=True)
+        pd.testing.assert_frame_equal(a, b, check_dtype=False)
+    print("incremental and backfilled rollups agree")
+
+
+if __name__ == "__main__":
+    main()
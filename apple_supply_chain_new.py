@@ -12,6 +12,20 @@ from PIL import Image
 import hashlib
 import ipfshttpclient
 import random
+import os
+import uuid
+from collections import Counter
+import profiling
+import ledger
+import farm_index
+import recall_index
+import analytics
+import telemetry_archive
+import inventory
+import live_telemetry
+import photo_pipeline
+import transport_simulator
+import verification_service
 
 # Set page config
 st.set_page_config(
@@ -80,16 +94,170 @@ if 'fertilizer_data' not in st.session_state:
     st.session_state.fertilizer_data = {}
 if 'harvest_data' not in st.session_state:
     st.session_state.harvest_data = {}
+if 'ledger_receipts' not in st.session_state:
+    st.session_state.ledger_receipts = []
+if 'cycle_inputs' not in st.session_state:
+    # Sowing and application record keys since the last harvest, linked to it for recalls
+    st.session_state.cycle_inputs = []
+    st.session_state.cycle_harvested = False
 
 # Mock IPFS client
 class MockIPFSClient:
+    @profiling.timed("ipfs.add_bytes")
     def add_bytes(self, data):
         return f"IPFS_{hashlib.sha256(data).hexdigest()[:10]}"
+    
+    @profiling.timed("ipfs.add_file")
+    def add_file(self, fileobj):
+        return f"IPFS_{photo_pipeline.hash_stream(fileobj)[:10]}"
 
 # Initialize mock IPFS client
 ipfs = MockIPFSClient()
 
-# Helper function to generate QR code
+# Ledger submission queue, shared by every session in this server process
+@st.cache_resource
+def get_ledger():
+    orderer = ledger.LocalOrderer(
+        latency=float(os.environ.get("TRACEABILITY_ORDERER_LATENCY", "0.3")),
+        failure_rate=float(os.environ.get("TRACEABILITY_ORDERER_FAILURE_RATE", "0"))
+    )
+    return ledger.LedgerClient(orderer).start()
+
+# Helper function to submit a record without waiting for the chain
+def submit_to_ledger(kind, record):
+    receipt = get_ledger().submit(kind, record)
+    st.session_state.ledger_receipts.append(receipt.tx_id)
+    return receipt
+
+# Geotagged photo processing pool, shared by every session
+@st.cache_resource
+def get_photo_pipeline():
+    return photo_pipeline.PhotoPipeline(max_workers=4)
+
+# Helper function to hash a field photo and queue its geotag check
+def add_field_photo(field_photo):
+    if not field_photo:
+        return "Not provided"
+    # One buffer for hashing and processing: getvalue() returns the upload's own bytes
+    data = field_photo.getvalue()
+    photo_hash = ipfs.add_bytes(data)
+    get_photo_pipeline().submit(
+        photo_hash,
+        data,
+        st.session_state.farmer_data["LandDetails"]["Coordinates"]
+    )
+    return photo_hash
+
+# Helper function to show a processed field photo as a thumbnail with its geotag check
+def show_field_photo(photo_hash):
+    if photo_hash == "Not provided":
+        return
+    try:
+        report = get_photo_pipeline().result(
+            photo_hash,
+            st.session_state.farmer_data["LandDetails"]["Coordinates"]
+        )
+    except KeyError:
+        st.caption("Field photo check is no longer cached")
+        return
+    if report is None:
+        st.info("Field photo is still being processed")
+    elif report["Thumbnail"] is None:
+        st.warning(f"Field photo: {report['LocationCheck']}")
+    else:
+        caption = f"Taken {report['TakenAt']}" if report["TakenAt"] else "Capture time unknown"
+        st.image(report["Thumbnail"], caption=caption)
+        if report["LocationCheck"] == "Verified":
+            st.success(f"Geotag verified: {report['DistanceKm']} km from registered plot")
+        elif report["LocationCheck"] == "Outside plot":
+            st.error(f"Geotag is {report['DistanceKm']} km from the registered plot")
+        else:
+            st.warning(f"Field photo: {report['LocationCheck']}")
+
+# Spatial index over every registered farm in this server process
+@st.cache_resource
+def get_farm_index():
+    return farm_index.FarmIndex()
+
+# Recall reverse indexes, updated on every write
+@st.cache_resource
+def get_recall_index():
+    return recall_index.RecallIndex()
+
+# Impact rollups, updated on every write and read by step 7
+@st.cache_resource
+def get_analytics():
+    return analytics.Rollups()
+
+# Compressed archive of closed shipments' sensor series
+@st.cache_resource
+def get_telemetry_archive():
+    return telemetry_archive.TelemetryArchive()
+
+# Versioned sale and allocation records, shared by every session
+@st.cache_resource
+def get_inventory():
+    return inventory.VersionedStore()
+
+# Helper function to key a record uniquely across farmers
+def record_key(record):
+    return f"{st.session_state.farmer_data['FarmerID']}:{record['RecordID']}"
+
+# Helper function to give a sowing, application or harvest its own id
+def new_record_id():
+    return uuid.uuid4().hex
+
+# Helper function to note a sowing or application as an input of the next harvest
+def add_cycle_input(record):
+    if st.session_state.cycle_harvested:
+        # First input after a harvest starts the next crop cycle
+        st.session_state.cycle_inputs = []
+        st.session_state.cycle_harvested = False
+    key = record_key(record)
+    if key not in st.session_state.cycle_inputs:
+        st.session_state.cycle_inputs.append(key)
+    return key
+
+# Metrics endpoint (no-op unless TRACEABILITY_METRICS=1)
+profiling.start_exporter()
+
+# Live transport panel: a fragment reruns only its own body, on a timer
+LIVE_REFRESH_SECONDS = float(os.environ.get("TRACEABILITY_LIVE_REFRESH", "2"))
+fragment = getattr(st, "fragment", None) or st.experimental_fragment
+
+def show_live_transport(feed):
+    with profiling.span("transport.live_tick"):
+        profiling.inc("live_readings_total", feed.poll())
+        stats = feed.stats
+        # A fragment redraws its chart each tick, so rows cannot be appended to the previous one;
+        # each tick sends a bounded window (the latest live_telemetry.WINDOW_READINGS readings)
+        st.line_chart(feed.window().set_index("Timestamp")["Temperature (°C)"], height=300)
+        
+        if stats.max_temp is not None and stats.max_temp > transport_simulator.SAFE_MAX_TEMP:
+            st.error(f"ALERT: Temperature reached {stats.max_temp:.1f}°C (Above safe threshold)")
+        else:
+            st.success("Temperature maintained within safe range (2-5°C)")
+        
+        cols = st.columns(3)
+        cols[0].metric("Transit Time", f"{stats.transit_hours:.1f} hours")
+        cols[1].metric("Avg Temperature", f"{stats.mean_temp:.1f}°C" if stats.mean_temp is not None else "-")
+        cols[2].metric("Avg Humidity", f"{stats.mean_humidity:.1f}%" if stats.mean_humidity is not None else "-")
+        if feed.done:
+            st.caption(f"All {len(feed)} readings received")
+        else:
+            st.caption(f"{feed.cursor}/{len(feed)} readings received, refreshing every {LIVE_REFRESH_SECONDS:g}s")
+
+@fragment(run_every=LIVE_REFRESH_SECONDS)
+def live_transport_panel():
+    feed = st.session_state.live_feed
+    show_live_transport(feed)
+    if feed.done:
+        # Last reading is in: one full rerun draws the panel without the fragment, stopping its timer
+        st.rerun()
+
+# Helper function to generate QR code (cached: the same record always renders the same image)
+@st.cache_data(show_spinner=False, max_entries=256)
+@profiling.timed("generate_qr_code")
 def generate_qr_code(data, size=200):
     qr = qrcode.QRCode(
         version=1,
@@ -111,8 +279,8 @@ def generate_qr_code(data, size=200):
 st.title("Blockchain Traceability Journey")
 st.subheader("From seed to sale - Complete digital traceability with blockchain")
 
-# Sidebar
-with st.sidebar:
+# Sidebar, timed on its own: its step buttons decide which step span follows
+with profiling.span("sidebar"), st.sidebar:
     st.image("https://cdn-icons-png.flaticon.com/512/2785/2785818.png", width=100)
     st.title("Traceability Steps")
     
@@ -134,806 +302,1133 @@ with st.sidebar:
     st.markdown("**Blockchain Explorer**")
     st.code("Network: Hyperledger Fabric", language="plaintext")
     st.code("Nodes: 7", language="plaintext")
-    st.code("Transactions: 84", language="plaintext")
+    ledger_stats = get_ledger().stats()
+    st.code(f"Transactions: {ledger_stats['committed']}", language="plaintext")
+    st.code(f"Pending: {ledger_stats['pending']}", language="plaintext")
     
     if st.button("View Smart Contract", key="view_contract"):
         st.session_state.show_contract = True
+    
+    with st.expander("Telemetry Archive"):
+        archived = get_telemetry_archive().shipments()
+        st.metric("Archived Shipments", len(archived))
+        if archived:
+            archived_shipment = st.selectbox("Shipment", archived[::-1], key="archive_shipment")
+            first, last = get_telemetry_archive().span(archived_shipment)
+            window = st.slider(
+                "Time Range",
+                min_value=first.to_pydatetime(),
+                max_value=max(last, first + pd.Timedelta(hours=1)).to_pydatetime(),
+                value=(first.to_pydatetime(), last.to_pydatetime()),
+                step=datetime.timedelta(hours=1),
+                format="MM-DD HH:mm",
+                key="archive_window"
+            )
+            archived_readings = get_telemetry_archive().read(archived_shipment, *window)
+            st.line_chart(archived_readings.set_index("Timestamp")["Temperature (°C)"], height=150)
+            st.caption(f"{len(archived_readings)} readings, archive {get_telemetry_archive().size_bytes() / 1024:.1f} KB")
+    
+    with st.expander("Recall Lookup"):
+        recall_type = st.radio("Input Type", ["Seed batch", "Fertilizer batch"], key="recall_type")
+        recall_batches = recall_index.parse_batches(st.text_area("Batch Numbers", key="recall_batches"))
+        if recall_batches:
+            if recall_type == "Seed batch":
+                recall_result = get_recall_index().recall(seed_batches=recall_batches)
+            else:
+                recall_result = get_recall_index().recall(fertilizer_batches=recall_batches)
+            st.metric("Affected Harvests", len(recall_result["harvests"]))
+            st.metric("Retail Quantity", f"{sum(r['QuantityKg'] for r in recall_result['retailers'])} kg")
+            if recall_result["retailers"]:
+                st.dataframe(pd.DataFrame(recall_result["retailers"]), hide_index=True)
+            st.download_button(
+                label="Download Recall List",
+                data=recall_index.export_csv(recall_result),
+                file_name="recall_list.csv",
+                mime="text/csv"
+            )
+    
+    if profiling.ENABLED:
+        st.divider()
+        st.checkbox("Sample this session (profiler)", key="profile_session")
+
+# Profiling: one span per rerun, named after the step branch being rendered
+profiling.inc("reruns_total", step=st.session_state.current_step)
+rerun_span = profiling.begin(f"step_{st.session_state.current_step}")
+session_profiler = None
+if profiling.ENABLED and st.session_state.get("profile_session", False):
+    session_profiler = profiling.SamplingProfiler().start()
 
-# Step 1: Farmer Registration
-if st.session_state.current_step == 1:
-    st.header("📝 Farmer Registration")
-    st.markdown("""
-    Farmers register with Aadhaar verification and GPS land mapping to create a permanent digital identity.
-    """)
+try:
+    # Step 1: Farmer Registration
+    if st.session_state.current_step == 1:
+        st.header("📝 Farmer Registration")
+        st.markdown("""
+        Farmers register with Aadhaar verification and GPS land mapping to create a permanent digital identity.
+        """)
     
-    col1, col2 = st.columns(2)
+        col1, col2 = st.columns(2)
     
-    with col1:
-        with st.form("farmer_registration"):
-            st.subheader("Farmer Details")
-            farmer_name = st.text_input("Full Name", value="Vijay Aswal")
-            aadhaar_number = st.text_input("Aadhaar Number", value="1234 5678 9012")
-            phone_number = st.text_input("Phone Number", value="+91 9876543210")
-            village = st.text_input("Village", value="Harsill")
-            district = st.text_input("District", value="Uttarkashi")
-            state = st.text_input("State", value="Uttarakhand")
-            
-            st.subheader("Land Details")
-            land_area = st.number_input("Land Area (acres)", min_value=0.1, value=2.5)
-            land_lat = st.number_input("Latitude", value=31.0383)
-            land_lon = st.number_input("Longitude", value=78.7377)
-            
-            submitted = st.form_submit_button("Register Farmer")
-            
-            if submitted:
-                # Hash Aadhaar number for privacy
-                aadhaar_hash = hashlib.sha256(aadhaar_number.encode()).hexdigest()
-                
-                # Generate Farmer ID
-                farmer_id = f"FARM{random.randint(1000, 9999)}"
+        with col1:
+            with st.form("farmer_registration"):
+                st.subheader("Farmer Details")
+                farmer_name = st.text_input("Full Name", value="Vijay Aswal")
+                aadhaar_number = st.text_input("Aadhaar Number", value="1234 5678 9012")
+                phone_number = st.text_input("Phone Number", value="+91 9876543210")
+                village = st.text_input("Village", value="Harsill")
+                district = st.text_input("District", value="Uttarkashi")
+                state = st.text_input("State", value="Uttarakhand")
+            
+                st.subheader("Land Details")
+                land_area = st.number_input("Land Area (acres)", min_value=0.1, value=2.5)
+                land_lat = st.number_input("Latitude", value=31.0383)
+                land_lon = st.number_input("Longitude", value=78.7377)
+            
+                submitted = st.form_submit_button("Register Farmer")
+            
+                if submitted:
+                    # Hash Aadhaar number for privacy
+                    aadhaar_hash = hashlib.sha256(aadhaar_number.encode()).hexdigest()
                 
-                # Store farmer data
-                st.session_state.farmer_data = {
-                    "FarmerID": farmer_id,
-                    "Name": farmer_name,
-                    "AadhaarHash": aadhaar_hash,
-                    "Phone": phone_number,
-                    "Location": {
-                        "Village": village,
-                        "District": district,
-                        "State": state
-                    },
-                    "LandDetails": {
-                        "Area": f"{land_area} acres",
-                        "Coordinates": f"{land_lat}°N, {land_lon}°E"
-                    },
-                    "RegistrationDate": datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
-                    "BlockchainTx": f"0x{hashlib.sha256(farmer_id.encode()).hexdigest()[:20]}"
-                }
+                    # Register under a Farmer ID no other farm holds (batch records are keyed by it)
+                    try:
+                        farmer_id = get_farm_index().add_new(
+                            lambda: f"FARM{random.randint(1000, 9999)}", land_lat, land_lon,
+                            district=district, Name=farmer_name, Village=village, Area=land_area
+                        )
+                    except RuntimeError as e:
+                        st.error(f"Could not assign a Farmer ID, please try again: {e}")
+                    else:
+                        # Store farmer data
+                        st.session_state.farmer_data = {
+                            "FarmerID": farmer_id,
+                            "Name": farmer_name,
+                            "AadhaarHash": aadhaar_hash,
+                            "Phone": phone_number,
+                            "Location": {
+                                "Village": village,
+                                "District": district,
+                                "State": state
+                            },
+                            "LandDetails": {
+                                "Area": f"{land_area} acres",
+                                "Coordinates": f"{land_lat}°N, {land_lon}°E"
+                            },
+                            "RegistrationDate": datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+                            "BlockchainTx": f"0x{hashlib.sha256(farmer_id.encode()).hexdigest()[:20]}"
+                        }
                 
-                st.session_state.farmer_registered = True
-                st.success("Farmer registered successfully on blockchain!")
+                        st.session_state.farmer_registered = True
+                        get_analytics().record_farm(farmer_id, district, land_area)
+                        submit_to_ledger("FarmerRegistered", st.session_state.farmer_data)
+                        st.success("Farmer registration submitted to blockchain!")
     
-    with col2:
-        if st.session_state.farmer_registered:
-            st.subheader("Farmer ID Card")
-            with st.container():
-                st.markdown(f"""
-                <div class="farmer-card">
-                    <h3 style="color: #4CAF50;">🌾 Farmer Digital ID</h3>
-                    <p><strong>ID:</strong> {st.session_state.farmer_data['FarmerID']}</p>
-                    <p><strong>Name:</strong> {st.session_state.farmer_data['Name']}</p>
-                    <p><strong>Location:</strong> {st.session_state.farmer_data['Location']['Village']}, {st.session_state.farmer_data['Location']['District']}</p>
-                    <p><strong>Land:</strong> {st.session_state.farmer_data['LandDetails']['Area']} @ {st.session_state.farmer_data['LandDetails']['Coordinates']}</p>
-                    <p><strong>Registered:</strong> {st.session_state.farmer_data['RegistrationDate']}</p>
-                </div>
-                """, unsafe_allow_html=True)
+        with col2:
+            if st.session_state.farmer_registered:
+                st.subheader("Farmer ID Card")
+                with st.container():
+                    st.markdown(f"""
+                    <div class="farmer-card">
+                        <h3 style="color: #4CAF50;">🌾 Farmer Digital ID</h3>
+                        <p><strong>ID:</strong> {st.session_state.farmer_data['FarmerID']}</p>
+                        <p><strong>Name:</strong> {st.session_state.farmer_data['Name']}</p>
+                        <p><strong>Location:</strong> {st.session_state.farmer_data['Location']['Village']}, {st.session_state.farmer_data['Location']['District']}</p>
+                        <p><strong>Land:</strong> {st.session_state.farmer_data['LandDetails']['Area']} @ {st.session_state.farmer_data['LandDetails']['Coordinates']}</p>
+                        <p><strong>Registered:</strong> {st.session_state.farmer_data['RegistrationDate']}</p>
+                    </div>
+                    """, unsafe_allow_html=True)
                 
-                # Generate and display QR code
-                qr_img = generate_qr_code(st.session_state.farmer_data)
-                st.image(qr_img, caption="Farmer ID QR Code", width=200)
+                    # Generate and display QR code
+                    qr_img = generate_qr_code(st.session_state.farmer_data)
+                    st.image(qr_img, caption="Farmer ID QR Code", width=200)
                 
-                st.download_button(
-                    label="Download Farmer ID Card",
-                    data=qr_img,
-                    file_name=f"{st.session_state.farmer_data['FarmerID']}_card.png",
-                    mime="image/png"
-                )
+                    st.download_button(
+                        label="Download Farmer ID Card",
+                        data=qr_img,
+                        file_name=f"{st.session_state.farmer_data['FarmerID']}_card.png",
+                        mime="image/png"
+                    )
             
-            st.subheader("Farm Location")
-            m = folium.Map(location=[land_lat, land_lon], zoom_start=14)
-            folium.Marker(
-                [land_lat, land_lon],
-                popup=f"{farmer_name}'s Farm",
-                tooltip=f"{land_area} acres",
-                icon=folium.Icon(color="green", icon="tree-conifer")
-            ).add_to(m)
-            folium_static(m)
+                st.subheader("Farm Location")
+                with profiling.span("map.farm_location"):
+                    m = folium.Map(location=[land_lat, land_lon], zoom_start=14)
+                    folium.Marker(
+                        [land_lat, land_lon],
+                        popup=f"{farmer_name}'s Farm",
+                        tooltip=f"{land_area} acres",
+                        icon=folium.Icon(color="green", icon="tree-conifer")
+                    ).add_to(m)
+                    folium_static(m)
+            else:
+                st.info("Please complete the registration form to generate Farmer ID and QR code")
+    
+        st.divider()
+        st.subheader("Registered Farms Network")
+        registered_farms = get_farm_index()
+    
+        if len(registered_farms) == 0:
+            st.info("No farms registered yet")
         else:
-            st.info("Please complete the registration form to generate Farmer ID and QR code")
-
-# Step 2: Sowing & Inputs
-elif st.session_state.current_step == 2:
-    st.header("🌱 Sowing & Input Management")
-    st.markdown("""
-    Record seed purchase and sowing details with geotagged verification.
-    """)
+            col3, col4 = st.columns(2)
+        
+            with col3:
+                map_zoom = st.slider("Map Zoom", farm_index.MIN_ZOOM, farm_index.MAX_ZOOM, 7, key="farm_map_zoom")
+                # Clusters are pre-aggregated per zoom level; only those in view are sent
+                clusters = registered_farms.clusters(
+                    map_zoom, farm_index.viewport_bbox(land_lat, land_lon, map_zoom, 400, 300)
+                )
+                with profiling.span("map.farm_clusters"):
+                    m = folium.Map(location=[land_lat, land_lon], zoom_start=map_zoom)
+                    for cluster in clusters:
+                        if cluster["count"] == 1 and cluster.get("farm"):
+                            farm = cluster["farm"]
+                            folium.CircleMarker(
+                                [farm["lat"], farm["lon"]],
+                                radius=6,
+                                color="#2E7D32",
+                                fill=True,
+                                tooltip=f"{farm['FarmerID']} · {farm.get('Name', '')} ({farm['District']})"
+                            ).add_to(m)
+                        else:
+                            folium.CircleMarker(
+                                [cluster["lat"], cluster["lon"]],
+                                radius=8 + 6 * np.log10(cluster["count"]),
+                                color="#4CAF50",
+                                fill=True,
+                                fill_opacity=0.6,
+                                tooltip=f"{cluster['count']} farms"
+                            ).add_to(m)
+                    folium_static(m, width=400, height=300)
+                st.caption(f"{len(clusters)} clusters covering {sum(c['count'] for c in clusters)} of {len(registered_farms)} farms in view")
+        
+            with col4:
+                st.markdown("**Find Farms**")
+                search_lat = st.number_input("Centre Latitude", value=land_lat, format="%.4f", key="farm_search_lat")
+                search_lon = st.number_input("Centre Longitude", value=land_lon, format="%.4f", key="farm_search_lon")
+                search_radius = st.number_input("Radius (km)", min_value=0.5, max_value=500.0, value=5.0, key="farm_search_radius")
+                nearby = registered_farms.within_radius(search_lat, search_lon, search_radius)
+                search_district = st.text_input("District", value=district, key="farm_search_district")
+                district_farms = registered_farms.in_district(search_district)
+            
+                st.metric(f"Farms within {search_radius:g} km", len(nearby))
+                st.metric(f"Farms in {search_district}", len(district_farms))
+                if nearby:
+                    st.dataframe(pd.DataFrame(nearby[:200])[["FarmerID", "Name", "District", "DistanceKm"]])
+
+    # Step 2: Sowing & Inputs
+    elif st.session_state.current_step == 2:
+        st.header("🌱 Sowing & Input Management")
+        st.markdown("""
+        Record seed purchase and sowing details with geotagged verification.
+        """)
     
-    if not st.session_state.farmer_registered:
-        st.warning("Please complete Farmer Registration first")
-        st.button("Go to Step 1", on_click=lambda: setattr(st.session_state, 'current_step', 1))
-    else:
-        col1, col2 = st.columns(2)
+        if not st.session_state.farmer_registered:
+            st.warning("Please complete Farmer Registration first")
+            st.button("Go to Step 1", on_click=lambda: setattr(st.session_state, 'current_step', 1))
+        else:
+            col1, col2 = st.columns(2)
         
-        with col1:
-            st.subheader("Seed Purchase")
-            with st.form("seed_purchase"):
-                seed_type = st.selectbox("Seed Type", ["Hybrid", "Organic", "GM", "Traditional"])
-                seed_variety = st.text_input("Seed Variety", value="Barnyard millet")
-                seed_batch = st.text_input("Seed Batch Number", value=f"SEED{random.randint(1000, 9999)}")
-                purchase_date = st.date_input("Purchase Date", datetime.date.today())
-                seller_name = st.text_input("Seller Name", value="Krishi Seva Kendra")
+            with col1:
+                st.subheader("Seed Purchase")
+                with st.form("seed_purchase"):
+                    seed_type = st.selectbox("Seed Type", ["Hybrid", "Organic", "GM", "Traditional"])
+                    seed_variety = st.text_input("Seed Variety", value="Barnyard millet")
+                    seed_batch = st.text_input("Seed Batch Number", value=f"SEED{random.randint(1000, 9999)}")
+                    purchase_date = st.date_input("Purchase Date", datetime.date.today())
+                    seller_name = st.text_input("Seller Name", value="Krishi Seva Kendra")
                 
-                submitted = st.form_submit_button("Record Seed Purchase")
-                if submitted:
-                    st.session_state.sowing_data["SeedPurchase"] = {
-                        "Type": seed_type,
-                        "Variety": seed_variety,
-                        "Batch": seed_batch,
-                        "PurchaseDate": purchase_date.strftime("%Y-%m-%d"),
-                        "Seller": seller_name,
-                        "BlockchainTx": f"0x{hashlib.sha256(seed_batch.encode()).hexdigest()[:20]}"
-                    }
-                    st.success("Seed purchase recorded on blockchain!")
+                    submitted = st.form_submit_button("Record Seed Purchase")
+                    if submitted:
+                        st.session_state.sowing_data["SeedPurchase"] = {
+                            "Type": seed_type,
+                            "Variety": seed_variety,
+                            "Batch": seed_batch,
+                            "PurchaseDate": purchase_date.strftime("%Y-%m-%d"),
+                            "Seller": seller_name,
+                            "BlockchainTx": f"0x{hashlib.sha256(seed_batch.encode()).hexdigest()[:20]}"
+                        }
+                        submit_to_ledger("SeedPurchased", st.session_state.sowing_data["SeedPurchase"])
+                        st.success("Seed purchase submitted to blockchain!")
         
-        with col2:
-            if "SeedPurchase" in st.session_state.sowing_data:
-                st.subheader("Seed Purchase QR")
-                qr_img = generate_qr_code(st.session_state.sowing_data["SeedPurchase"])
-                st.image(qr_img, width=200)
+            with col2:
+                if "SeedPurchase" in st.session_state.sowing_data:
+                    st.subheader("Seed Purchase QR")
+                    qr_img = generate_qr_code(st.session_state.sowing_data["SeedPurchase"])
+                    st.image(qr_img, width=200)
                 
-                st.json(st.session_state.sowing_data["SeedPurchase"])
+                    st.json(st.session_state.sowing_data["SeedPurchase"])
         
-        st.divider()
+            st.divider()
         
-        col3, col4 = st.columns(2)
+            col3, col4 = st.columns(2)
         
-        with col3:
-            st.subheader("Sowing Activity")
-            with st.form("sowing_activity"):
-                sowing_date = st.date_input("Sowing Date", datetime.date.today())
-                sowing_method = st.selectbox("Sowing Method", ["Manual", "Machine", "Drones"])
-                field_photo = st.file_uploader("Field Photo (Geotagged)", type=["jpg", "png"])
-                soil_report = st.file_uploader("Soil Test Report", type=["pdf", "jpg", "png"])
+            with col3:
+                st.subheader("Sowing Activity")
+                with st.form("sowing_activity"):
+                    sowing_date = st.date_input("Sowing Date", datetime.date.today())
+                    sowing_method = st.selectbox("Sowing Method", ["Manual", "Machine", "Drones"])
+                    field_photo = st.file_uploader("Field Photo (Geotagged)", type=["jpg", "png"])
+                    soil_report = st.file_uploader("Soil Test Report", type=["pdf", "jpg", "png"])
                 
-                submitted = st.form_submit_button("Record Sowing Activity")
-                if submitted:
-                    # Mock IPFS upload for photos
-                    field_photo_hash = ipfs.add_bytes(field_photo.read()) if field_photo else "Not provided"
-                    soil_report_hash = ipfs.add_bytes(soil_report.read()) if soil_report else "Not provided"
+                    submitted = st.form_submit_button("Record Sowing Activity")
+                    if submitted:
+                        # Mock IPFS upload for photos; geotag checks run in the background
+                        field_photo_hash = add_field_photo(field_photo)
+                        soil_report_hash = ipfs.add_file(soil_report) if soil_report else "Not provided"
                     
-                    st.session_state.sowing_data["Sowing"] = {
-                        "FarmerID": st.session_state.farmer_data["FarmerID"],
-                        "SeedBatch": st.session_state.sowing_data["SeedPurchase"]["Batch"],
-                        "Date": sowing_date.strftime("%Y-%m-%d"),
-                        "Method": sowing_method,
-                        "FieldPhoto": field_photo_hash,
-                        "SoilReport": soil_report_hash,
-                        "Location": st.session_state.farmer_data["LandDetails"]["Coordinates"],
-                        "BlockchainTx": f"0x{hashlib.sha256(str(sowing_date).encode()).hexdigest()[:20]}"
-                    }
-                    st.success("Sowing activity recorded on blockchain!")
+                        st.session_state.sowing_data["Sowing"] = {
+                            "FarmerID": st.session_state.farmer_data["FarmerID"],
+                            "SeedBatch": st.session_state.sowing_data["SeedPurchase"]["Batch"],
+                            "Date": sowing_date.strftime("%Y-%m-%d"),
+                            "Method": sowing_method,
+                            "FieldPhoto": field_photo_hash,
+                            "SoilReport": soil_report_hash,
+                            "Location": st.session_state.farmer_data["LandDetails"]["Coordinates"],
+                            "BlockchainTx": f"0x{hashlib.sha256(str(sowing_date).encode()).hexdigest()[:20]}",
+                            "RecordID": new_record_id()
+                        }
+                        get_recall_index().record_sowing(
+                            add_cycle_input(st.session_state.sowing_data["Sowing"]),
+                            st.session_state.sowing_data["SeedPurchase"]["Batch"]
+                        )
+                        submit_to_ledger("SowingRecorded", st.session_state.sowing_data["Sowing"])
+                        st.success("Sowing activity submitted to blockchain!")
         
-        with col4:
-            if "Sowing" in st.session_state.sowing_data:
-                st.subheader("Sowing Record QR")
-                qr_img = generate_qr_code(st.session_state.sowing_data["Sowing"])
-                st.image(qr_img, width=200)
+            with col4:
+                if "Sowing" in st.session_state.sowing_data:
+                    st.subheader("Sowing Record QR")
+                    qr_img = generate_qr_code(st.session_state.sowing_data["Sowing"])
+                    st.image(qr_img, width=200)
                 
-                st.json(st.session_state.sowing_data["Sowing"])
+                    st.json(st.session_state.sowing_data["Sowing"])
+                    show_field_photo(st.session_state.sowing_data["Sowing"]["FieldPhoto"])
                 
-                if st.button("Proceed to Growth Monitoring"):
-                    st.session_state.current_step = 3
-
-# Step 3: Growth Monitoring
-elif st.session_state.current_step == 3:
-    st.header("🌿 Crop Growth Monitoring")
-    st.markdown("""
-    Track fertilizer use and crop growth with verifiable records.
-    """)
+                    if st.button("Proceed to Growth Monitoring"):
+                        st.session_state.current_step = 3
+
+    # Step 3: Growth Monitoring
+    elif st.session_state.current_step == 3:
+        st.header("🌿 Crop Growth Monitoring")
+        st.markdown("""
+        Track fertilizer use and crop growth with verifiable records.
+        """)
     
-    if not st.session_state.sowing_data:
-        st.warning("Please complete Sowing & Inputs first")
-        st.button("Go to Step 2", on_click=lambda: setattr(st.session_state, 'current_step', 2))
-    else:
-        col1, col2 = st.columns(2)
+        if not st.session_state.sowing_data:
+            st.warning("Please complete Sowing & Inputs first")
+            st.button("Go to Step 2", on_click=lambda: setattr(st.session_state, 'current_step', 2))
+        else:
+            col1, col2 = st.columns(2)
         
-        with col1:
-            st.subheader("Fertilizer Purchase")
-            with st.form("fertilizer_purchase"):
-                fert_type = st.selectbox("Fertilizer Type", ["Organic", "Urea", "DAP", "NPK", "Compost"])
-                fert_batch = st.text_input("Fertilizer Batch", value=f"FERT{random.randint(1000, 9999)}")
-                purchase_date = st.date_input("Purchase Date", datetime.date.today())
-                seller_name = st.text_input("Seller Name", value="Krishi Seva Kendra")
-                quantity = st.number_input("Quantity (kg)", min_value=1, value=50)
+            with col1:
+                st.subheader("Fertilizer Purchase")
+                with st.form("fertilizer_purchase"):
+                    fert_type = st.selectbox("Fertilizer Type", ["Organic", "Urea", "DAP", "NPK", "Compost"])
+                    fert_batch = st.text_input("Fertilizer Batch", value=f"FERT{random.randint(1000, 9999)}")
+                    purchase_date = st.date_input("Purchase Date", datetime.date.today())
+                    seller_name = st.text_input("Seller Name", value="Krishi Seva Kendra")
+                    quantity = st.number_input("Quantity (kg)", min_value=1, value=50)
                 
-                submitted = st.form_submit_button("Record Purchase")
-                if submitted:
-                    st.session_state.fertilizer_data["Purchase"] = {
-                        "Type": fert_type,
-                        "Batch": fert_batch,
-                        "Date": purchase_date.strftime("%Y-%m-%d"),
-                        "Seller": seller_name,
-                        "Quantity": f"{quantity}kg",
-                        "BlockchainTx": f"0x{hashlib.sha256(fert_batch.encode()).hexdigest()[:20]}"
-                    }
-                    st.success("Fertilizer purchase recorded on blockchain!")
+                    submitted = st.form_submit_button("Record Purchase")
+                    if submitted:
+                        st.session_state.fertilizer_data["Purchase"] = {
+                            "Type": fert_type,
+                            "Batch": fert_batch,
+                            "Date": purchase_date.strftime("%Y-%m-%d"),
+                            "Seller": seller_name,
+                            "Quantity": f"{quantity}kg",
+                            "BlockchainTx": f"0x{hashlib.sha256(fert_batch.encode()).hexdigest()[:20]}"
+                        }
+                        submit_to_ledger("FertilizerPurchased", st.session_state.fertilizer_data["Purchase"])
+                        st.success("Fertilizer purchase submitted to blockchain!")
         
-        with col2:
-            if "Purchase" in st.session_state.fertilizer_data:
-                st.subheader("Fertilizer Purchase QR")
-                qr_img = generate_qr_code(st.session_state.fertilizer_data["Purchase"])
-                st.image(qr_img, width=200)
+            with col2:
+                if "Purchase" in st.session_state.fertilizer_data:
+                    st.subheader("Fertilizer Purchase QR")
+                    qr_img = generate_qr_code(st.session_state.fertilizer_data["Purchase"])
+                    st.image(qr_img, width=200)
                 
-                st.json(st.session_state.fertilizer_data["Purchase"])
+                    st.json(st.session_state.fertilizer_data["Purchase"])
         
-        st.divider()
+            st.divider()
         
-        col3, col4 = st.columns(2)
+            col3, col4 = st.columns(2)
         
-        with col3:
-            st.subheader("Fertilizer Application")
-            if "Purchase" not in st.session_state.fertilizer_data:
-                st.warning("Record fertilizer purchase first")
-            else:
-                with st.form("fertilizer_application"):
-                    application_date = st.date_input("Application Date", datetime.date.today())
-                    quantity_used = st.number_input("Quantity Used (kg)", 
-                                                  min_value=1, 
-                                                  max_value=int(st.session_state.fertilizer_data["Purchase"]["Quantity"].replace("kg", "")), 
-                                                  value=10)
-                    field_photo = st.file_uploader("Application Photo (Geotagged)", type=["jpg", "png"])
-                    notes = st.text_area("Application Notes")
+            with col3:
+                st.subheader("Fertilizer Application")
+                if "Purchase" not in st.session_state.fertilizer_data:
+                    st.warning("Record fertilizer purchase first")
+                else:
+                    with st.form("fertilizer_application"):
+                        application_date = st.date_input("Application Date", datetime.date.today())
+                        quantity_used = st.number_input("Quantity Used (kg)", 
+                                                      min_value=1, 
+                                                      max_value=int(st.session_state.fertilizer_data["Purchase"]["Quantity"].replace("kg", "")), 
+                                                      value=10)
+                        field_photo = st.file_uploader("Application Photo (Geotagged)", type=["jpg", "png"])
+                        notes = st.text_area("Application Notes")
                     
-                    submitted = st.form_submit_button("Record Application")
-                    if submitted:
-                        # Mock IPFS upload for photo
-                        field_photo_hash = ipfs.add_bytes(field_photo.read()) if field_photo else "Not provided"
+                        submitted = st.form_submit_button("Record Application")
+                        if submitted:
+                            # Mock IPFS upload for photo; geotag checks run in the background
+                            field_photo_hash = add_field_photo(field_photo)
                         
-                        st.session_state.fertilizer_data["Application"] = {
-                            "PurchaseTx": st.session_state.fertilizer_data["Purchase"]["BlockchainTx"],
-                            "Date": application_date.strftime("%Y-%m-%d"),
-                            "QuantityUsed": f"{quantity_used}kg",
-                            "FieldPhoto": field_photo_hash,
-                            "Notes": notes,
-                            "Location": st.session_state.farmer_data["LandDetails"]["Coordinates"],
-                            "BlockchainTx": f"0x{hashlib.sha256(str(application_date).encode()).hexdigest()[:20]}"
-                        }
-                        st.success("Fertilizer application recorded on blockchain!")
+                            st.session_state.fertilizer_data["Application"] = {
+                                "PurchaseTx": st.session_state.fertilizer_data["Purchase"]["BlockchainTx"],
+                                "Date": application_date.strftime("%Y-%m-%d"),
+                                "QuantityUsed": f"{quantity_used}kg",
+                                "FieldPhoto": field_photo_hash,
+                                "Notes": notes,
+                                "Location": st.session_state.farmer_data["LandDetails"]["Coordinates"],
+                                "BlockchainTx": f"0x{hashlib.sha256(str(application_date).encode()).hexdigest()[:20]}",
+                                "RecordID": new_record_id()
+                            }
+                            get_recall_index().record_application(
+                                add_cycle_input(st.session_state.fertilizer_data["Application"]),
+                                st.session_state.fertilizer_data["Purchase"]["Batch"]
+                            )
+                            get_analytics().record_fertilizer(st.session_state.farmer_data["FarmerID"], quantity_used)
+                            submit_to_ledger("FertilizerApplied", st.session_state.fertilizer_data["Application"])
+                            st.success("Fertilizer application submitted to blockchain!")
         
-        with col4:
-            if "Application" in st.session_state.fertilizer_data:
-                st.subheader("Application Record QR")
-                qr_img = generate_qr_code(st.session_state.fertilizer_data["Application"])
-                st.image(qr_img, width=200)
+            with col4:
+                if "Application" in st.session_state.fertilizer_data:
+                    st.subheader("Application Record QR")
+                    qr_img = generate_qr_code(st.session_state.fertilizer_data["Application"])
+                    st.image(qr_img, width=200)
                 
-                st.json(st.session_state.fertilizer_data["Application"])
+                    st.json(st.session_state.fertilizer_data["Application"])
+                    show_field_photo(st.session_state.fertilizer_data["Application"]["FieldPhoto"])
                 
-                if st.button("Proceed to Harvest"):
-                    st.session_state.current_step = 4
-
-# Step 4: Harvest & Sale
-elif st.session_state.current_step == 4:
-    st.header("🌾 Harvest & Sale")
-    st.markdown("""
-    Record harvest details and connect with buyers through verified transactions.
-    """)
+                    if st.button("Proceed to Harvest"):
+                        st.session_state.current_step = 4
+
+    # Step 4: Harvest & Sale
+    elif st.session_state.current_step == 4:
+        st.header("🌾 Harvest & Sale")
+        st.markdown("""
+        Record harvest details and connect with buyers through verified transactions.
+        """)
     
-    if not st.session_state.fertilizer_data:
-        st.warning("Please complete Growth Monitoring first")
-        st.button("Go to Step 3", on_click=lambda: setattr(st.session_state, 'current_step', 3))
-    else:
-        col1, col2 = st.columns(2)
+        if not st.session_state.fertilizer_data:
+            st.warning("Please complete Growth Monitoring first")
+            st.button("Go to Step 3", on_click=lambda: setattr(st.session_state, 'current_step', 3))
+        else:
+            col1, col2 = st.columns(2)
         
-        with col1:
-            st.subheader("Harvest Details")
-            with st.form("harvest_details"):
-                harvest_date = st.date_input("Harvest Date", datetime.date.today())
-                crop_variety = st.text_input("Crop Variety", value="Sharbati Wheat")
-                quantity = st.number_input("Harvest Quantity (kg)", min_value=1, value=500)
-                quality = st.select_slider("Quality Grade", options=["A", "B", "C"], value="A")
-                last_spray = st.date_input("Last Pesticide Spray Date", datetime.date.today() - datetime.timedelta(days=20))
+            with col1:
+                st.subheader("Harvest Details")
+                with st.form("harvest_details"):
+                    harvest_date = st.date_input("Harvest Date", datetime.date.today())
+                    crop_variety = st.text_input("Crop Variety", value="Sharbati Wheat")
+                    quantity = st.number_input("Harvest Quantity (kg)", min_value=1, value=500)
+                    quality = st.select_slider("Quality Grade", options=["A", "B", "C"], value="A")
+                    last_spray = st.date_input("Last Pesticide Spray Date", datetime.date.today() - datetime.timedelta(days=20))
                 
-                submitted = st.form_submit_button("Record Harvest")
-                if submitted:
-                    if (harvest_date - last_spray).days < 15:
-                        st.error("Harvest must be at least 15 days after last pesticide spray")
-                    else:
-                        st.session_state.harvest_data = {
-                            "FarmerID": st.session_state.farmer_data["FarmerID"],
-                            "Date": harvest_date.strftime("%Y-%m-%d"),
-                            "Crop": crop_variety,
-                            "Quantity": f"{quantity}kg",
-                            "Quality": quality,
-                            "LastSpray": last_spray.strftime("%Y-%m-%d"),
-                            "BlockchainTx": f"0x{hashlib.sha256(str(harvest_date).encode()).hexdigest()[:20]}"
-                        }
-                        st.success("Harvest recorded on blockchain!")
+                    submitted = st.form_submit_button("Record Harvest")
+                    if submitted:
+                        if (harvest_date - last_spray).days < 15:
+                            st.error("Harvest must be at least 15 days after last pesticide spray")
+                        else:
+                            st.session_state.harvest_data = {
+                                "FarmerID": st.session_state.farmer_data["FarmerID"],
+                                "Date": harvest_date.strftime("%Y-%m-%d"),
+                                "Crop": crop_variety,
+                                "Quantity": f"{quantity}kg",
+                                "Quality": quality,
+                                "LastSpray": last_spray.strftime("%Y-%m-%d"),
+                                "BlockchainTx": f"0x{hashlib.sha256(str(harvest_date).encode()).hexdigest()[:20]}",
+                                # Own id per harvest: same-day harvests and re-recordings are separate batches
+                                "RecordID": new_record_id()
+                            }
+                            # Every sowing and application since the last harvest fed this one
+                            get_recall_index().record_harvest(
+                                record_key(st.session_state.harvest_data),
+                                list(st.session_state.cycle_inputs),
+                                FarmerID=st.session_state.farmer_data["FarmerID"],
+                                Crop=crop_variety,
+                                QuantityKg=quantity
+                            )
+                            st.session_state.cycle_harvested = True
+                            submit_to_ledger("HarvestRecorded", st.session_state.harvest_data)
+                            st.success("Harvest submitted to blockchain!")
         
-        with col2:
-            if st.session_state.harvest_data:
-                st.subheader("Harvest QR Code")
-                qr_img = generate_qr_code(st.session_state.harvest_data)
-                st.image(qr_img, width=200)
+            with col2:
+                if st.session_state.harvest_data:
+                    st.subheader("Harvest QR Code")
+                    qr_img = generate_qr_code(st.session_state.harvest_data)
+                    st.image(qr_img, width=200)
                 
-                st.json(st.session_state.harvest_data)
+                    st.json(st.session_state.harvest_data)
         
-        st.divider()
+            st.divider()
         
-        # Sale Transaction (separate from the form)
-        if st.session_state.harvest_data:
-            st.subheader("Sale Transaction")
-            
-            # Input fields for sale
-            buyer_name = st.text_input("Buyer Name", value="AgriMarkt Pvt Ltd", key="buyer_name")
-            buyer_id = st.text_input("Buyer ID", value="BUYER123", key="buyer_id")
-            price = st.number_input("Price per kg (₹)", min_value=1, value=25, key="price_per_kg")
-            payment_method = st.selectbox("Payment Method", ["UPI", "Bank Transfer", "Cash"], key="payment_method")
-            
-            # Button outside any form
-            if st.button("Record Sale"):
-                total = price * int(st.session_state.harvest_data["Quantity"].replace("kg", ""))
-                st.session_state.harvest_data["Sale"] = {
-                    "Buyer": buyer_name,
-                    "BuyerID": buyer_id,
-                    "Price": f"₹{price}/kg",
-                    "Total": f"₹{total}",
-                    "PaymentMethod": payment_method,
-                    "PaymentStatus": "Completed",
-                    "Timestamp": datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
-                    "BlockchainTx": f"0x{hashlib.sha256(buyer_id.encode()).hexdigest()[:20]}"
-                }
-                st.success(f"Sale recorded successfully! ₹{total} transferred to farmer.")
-                
-                # Generate QR stickers for each sack (mock)
-                st.session_state.harvest_data["QR_Stickers"] = [
-                    f"QR_{random.randint(1000, 9999)}" for _ in range(int(quantity/50))
-                ]
+            # Sale Transaction (separate from the form)
+            if st.session_state.harvest_data:
+                st.subheader("Sale Transaction")
+                if "Sale" not in st.session_state.harvest_data:
+                    # A sale already recorded for this harvest (e.g. from another tab) belongs in it
+                    existing_sale = inventory.sale_of(get_inventory(), record_key(st.session_state.harvest_data))
+                    if existing_sale is not None:
+                        st.session_state.harvest_data["Sale"] = existing_sale
+            
+                # Input fields for sale
+                buyer_name = st.text_input("Buyer Name", value="AgriMarkt Pvt Ltd", key="buyer_name")
+                buyer_id = st.text_input("Buyer ID", value="BUYER123", key="buyer_id")
+                price = st.number_input("Price per kg (₹)", min_value=1, value=25, key="price_per_kg")
+                payment_method = st.selectbox("Payment Method", ["UPI", "Bank Transfer", "Cash"], key="payment_method")
+            
+                # Button outside any form
+                if st.button("Record Sale"):
+                    total = price * int(st.session_state.harvest_data["Quantity"].replace("kg", ""))
+                    sale = {
+                        "Buyer": buyer_name,
+                        "BuyerID": buyer_id,
+                        "Price": f"₹{price}/kg",
+                        "Total": f"₹{total}",
+                        "PaymentMethod": payment_method,
+                        "PaymentStatus": "Completed",
+                        "Timestamp": datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+                        "BlockchainTx": f"0x{hashlib.sha256(buyer_id.encode()).hexdigest()[:20]}"
+                    }
+                    try:
+                        # Create-only write: a second sale of the same batch is rejected
+                        inventory.record_sale(get_inventory(), record_key(st.session_state.harvest_data), sale)
+                    except inventory.AlreadySold as e:
+                        # Keyed by this harvest's id, so the existing sale is this harvest's own
+                        st.session_state.harvest_data["Sale"] = e.sale
+                        st.warning(f"This harvest was already sold to {e.sale['Buyer']} ({e.sale['Timestamp']})")
+                    else:
+                        st.session_state.harvest_data["Sale"] = sale
+                        get_recall_index().record_sale(
+                            record_key(st.session_state.harvest_data),
+                            st.session_state.harvest_data["Sale"]["BlockchainTx"],
+                            buyer_name
+                        )
+                        get_analytics().record_sale(
+                            st.session_state.harvest_data["Crop"],
+                            st.session_state.farmer_data["Location"]["District"],
+                            price,
+                            int(st.session_state.harvest_data["Quantity"].replace("kg", ""))
+                        )
+                        submit_to_ledger("BatchSold", st.session_state.harvest_data["Sale"])
+                        st.success(f"Sale recorded successfully! ₹{total} transferred to farmer.")
+                    
+                        # Generate QR stickers for each sack (mock)
+                        st.session_state.harvest_data["QR_Stickers"] = [
+                            f"QR_{random.randint(1000, 9999)}" for _ in range(int(quantity/50))
+                        ]
                 
-            # Proceed button (only shown after sale is recorded)
-            if "Sale" in st.session_state.harvest_data:
-                if st.button("Proceed to Transport"):
-                    st.session_state.current_step = 5
-
-# Step 5: Transport Tracking
-elif st.session_state.current_step == 5:
-    st.header("🚚 Transport Tracking")
-    st.markdown("""
-    IoT sensors monitor temperature, humidity, and location during transport.
-    Data is recorded on blockchain for immutable tracking.
-    """)
+                # Proceed button (only shown after sale is recorded)
+                if "Sale" in st.session_state.harvest_data:
+                    if st.button("Proceed to Transport"):
+                        st.session_state.current_step = 5
+
+    # Step 5: Transport Tracking
+    elif st.session_state.current_step == 5:
+        st.header("🚚 Transport Tracking")
+        st.markdown("""
+        IoT sensors monitor temperature, humidity, and location during transport.
+        Data is recorded on blockchain for immutable tracking.
+        """)
     
-    if not st.session_state.harvest_data or "Sale" not in st.session_state.harvest_data:
-        st.warning("Please complete Harvest & Sale first")
-        st.button("Go to Step 4", on_click=lambda: setattr(st.session_state, 'current_step', 4))
-    else:
-        if 'transport_data' not in st.session_state or st.session_state.transport_data.empty:
-            # Generate simulated transport data
-            timestamps = pd.date_range(
-                start=pd.Timestamp(st.session_state.harvest_data["Date"]) + pd.Timedelta(hours=1),
-                periods=24,
-                freq="H"
-            )
-            
-            base_temp = np.random.normal(4, 0.5, 24)
-            if np.random.random() > 0.7:
-                spike_pos = np.random.randint(8, 18)
-                base_temp[spike_pos] += np.random.uniform(2, 5)
-            
-            transport_df = pd.DataFrame({
-                "Timestamp": timestamps,
-                "Temperature (°C)": np.clip(base_temp, 2, 10),
-                "Humidity (%)": np.random.normal(65, 5, 24),
-                "Location": [
-                    f"{18.5 - i*0.02:.4f}°N, {73.8 + i*0.1:.4f}°E" 
-                    for i in range(24)
-                ]
-            })
-            st.session_state.transport_data = transport_df
-        
-        st.subheader("Transport Simulation")
+        if not st.session_state.harvest_data or "Sale" not in st.session_state.harvest_data:
+            st.warning("Please complete Harvest & Sale first")
+            st.button("Go to Step 4", on_click=lambda: setattr(st.session_state, 'current_step', 4))
+        else:
+            if 'transport_data' not in st.session_state or st.session_state.transport_data.empty:
+                with profiling.span("transport.simulate"):
+                    # Generate simulated transport data (Pune hub to Mumbai, hourly readings)
+                    transport_df = transport_simulator.simulate_shipment(
+                        start=pd.Timestamp(st.session_state.harvest_data["Date"]) + pd.Timedelta(hours=1),
+                        n_readings=24
+                    )
+                    st.session_state.transport_data = transport_df
         
-        col1, col2 = st.columns(2)
+            st.subheader("Transport Simulation")
         
-        with col1:
-            st.line_chart(
-                st.session_state.transport_data.set_index("Timestamp")["Temperature (°C)"],
-                height=300
+            live_mode = st.toggle(
+                "Live sensor feed",
+                key="transport_live",
+                help="Refresh only the chart, alert and metrics as new readings arrive"
             )
+            if live_mode:
+                live_shipment = f"{record_key(st.session_state.harvest_data)}@{st.session_state.transport_data['Timestamp'].iloc[0]}"
+                if st.session_state.get("live_feed") is None or st.session_state.live_feed.shipment_id != live_shipment:
+                    st.session_state.live_feed = live_telemetry.LiveFeed(
+                        live_shipment, st.session_state.transport_data, interval=LIVE_REFRESH_SECONDS
+                    )
+        
+            col1, col2 = st.columns(2)
+        
+            with col1:
+                max_temp = st.session_state.transport_data["Temperature (°C)"].max()
+                if live_mode and st.session_state.live_feed.done:
+                    show_live_transport(st.session_state.live_feed)
+                elif live_mode:
+                    live_transport_panel()
+                else:
+                    with profiling.span("chart.temperature"):
+                        st.line_chart(
+                            st.session_state.transport_data.set_index("Timestamp")["Temperature (°C)"],
+                            height=300
+                        )
+                
+                    if max_temp > 5:
+                        st.error(f"ALERT: Temperature reached {max_temp:.1f}°C (Above safe threshold)")
+                    else:
+                        st.success("Temperature maintained within safe range (2-5°C)")
             
-            max_temp = st.session_state.transport_data["Temperature (°C)"].max()
-            if max_temp > 5:
-                st.error(f"ALERT: Temperature reached {max_temp:.1f}°C (Above safe threshold)")
-            else:
-                st.success("Temperature maintained within safe range (2-5°C)")
-            
-            st.subheader("Route Tracking")
-            m = folium.Map(location=[18.5, 73.8], zoom_start=8)
-            
-            route_locations = [
-                [18.5204, 73.8567],  # Farm location
-                [18.5, 74.0],
-                [18.4, 74.2],
-                [18.3, 74.5],
-                [18.2, 74.8],
-                [18.1, 75.0],
-                [18.0, 75.5],
-                [19.0, 72.8],  # Mumbai
-            ]
-            folium.PolyLine(route_locations, color="blue", weight=2.5, opacity=1).add_to(m)
-            
-            folium.Marker(
-                route_locations[0],
-                popup="Farm (Origin)",
-                icon=folium.Icon(color="green")
-            ).add_to(m)
-            
-            folium.Marker(
-                route_locations[-1],
-                popup="Mumbai (Destination)",
-                icon=folium.Icon(color="red")
-            ).add_to(m)
-            
-            folium_static(m, width=400, height=300)
+                st.subheader("Route Tracking")
+                with profiling.span("map.route"):
+                    m = folium.Map(location=[18.5, 73.8], zoom_start=8)
+            
+                    route_locations = [
+                        [18.5204, 73.8567],  # Farm location
+                        [18.5, 74.0],
+                        [18.4, 74.2],
+                        [18.3, 74.5],
+                        [18.2, 74.8],
+                        [18.1, 75.0],
+                        [18.0, 75.5],
+                        [19.0, 72.8],  # Mumbai
+                    ]
+                    folium.PolyLine(route_locations, color="blue", weight=2.5, opacity=1).add_to(m)
+            
+                    folium.Marker(
+                        route_locations[0],
+                        popup="Farm (Origin)",
+                        icon=folium.Icon(color="green")
+                    ).add_to(m)
+            
+                    folium.Marker(
+                        route_locations[-1],
+                        popup="Mumbai (Destination)",
+                        icon=folium.Icon(color="red")
+                    ).add_to(m)
+            
+                    folium_static(m, width=400, height=300)
         
-        with col2:
-            st.dataframe(st.session_state.transport_data)
-            
-            st.subheader("Transport Metadata")
-            transport_time = st.session_state.transport_data["Timestamp"].iloc[-1] - st.session_state.transport_data["Timestamp"].iloc[0]
-            st.metric("Total Transit Time", f"{transport_time.seconds/3600:.1f} hours")
-            st.metric("Average Temperature", f"{st.session_state.transport_data['Temperature (°C)'].mean():.1f}°C")
-            st.metric("Average Humidity", f"{st.session_state.transport_data['Humidity (%)'].mean():.1f}%")
-            
-            # Generate transport QR
-            transport_summary = {
-                "BatchID": st.session_state.harvest_data.get("BlockchainTx", ""),
-                "From": st.session_state.farmer_data["Location"]["Village"],
-                "To": "Mumbai",
-                "StartTime": str(st.session_state.transport_data["Timestamp"].iloc[0]),
-                "EndTime": str(st.session_state.transport_data["Timestamp"].iloc[-1]),
-                "AvgTemp": f"{st.session_state.transport_data['Temperature (°C)'].mean():.1f}°C",
-                "Alerts": "None" if max_temp <= 5 else "High temperature detected"
-            }
+            with col2:
+                transport_time = st.session_state.transport_data["Timestamp"].iloc[-1] - st.session_state.transport_data["Timestamp"].iloc[0]
+                if live_mode:
+                    # Readings received as of this full run; the live panel carries the running metrics
+                    st.dataframe(st.session_state.live_feed.readings.iloc[:max(st.session_state.live_feed.cursor, 1)])
+                else:
+                    st.dataframe(st.session_state.transport_data)
+                
+                    st.subheader("Transport Metadata")
+                    st.metric("Total Transit Time", f"{transport_time.seconds/3600:.1f} hours")
+                    st.metric("Average Temperature", f"{st.session_state.transport_data['Temperature (°C)'].mean():.1f}°C")
+                    st.metric("Average Humidity", f"{st.session_state.transport_data['Humidity (%)'].mean():.1f}%")
+            
+                if live_mode and not st.session_state.live_feed.done:
+                    # The summary and the archived shipment cover the full series, so wait for all of it
+                    st.caption("Transport QR and completion are available once every reading has arrived.")
+                else:
+                    # Generate transport QR
+                    transport_summary = {
+                        "BatchID": st.session_state.harvest_data.get("BlockchainTx", ""),
+                        "From": st.session_state.farmer_data["Location"]["Village"],
+                        "To": "Mumbai",
+                        "StartTime": str(st.session_state.transport_data["Timestamp"].iloc[0]),
+                        "EndTime": str(st.session_state.transport_data["Timestamp"].iloc[-1]),
+                        "AvgTemp": f"{st.session_state.transport_data['Temperature (°C)'].mean():.1f}°C",
+                        "Alerts": "None" if max_temp <= 5 else "High temperature detected"
+                    }
             
-            st.subheader("Transport QR Code")
-            qr_img = generate_qr_code(transport_summary)
-            st.image(qr_img, width=200)
+                    st.subheader("Transport QR Code")
+                    qr_img = generate_qr_code(transport_summary)
+                    st.image(qr_img, width=200)
             
-            if st.button("Complete Transport"):
-                st.session_state.current_step = 6
+                    if st.button("Complete Transport"):
+                        # Farmer-scoped: batch hashes alone repeat across farms harvesting the same day
+                        shipment_id = f"{record_key(st.session_state.harvest_data)}@{transport_summary['StartTime']}"
+                        # A no-op if this shipment was already archived, by this or another app process
+                        get_telemetry_archive().append(shipment_id, st.session_state.transport_data)
+                        get_recall_index().record_shipment(
+                            record_key(st.session_state.harvest_data),
+                            shipment_id,
+                            transport_summary["To"]
+                        )
+                        get_analytics().record_shipment(
+                            shipment_id,
+                            transport_summary["From"],
+                            transport_summary["To"],
+                            transport_time.total_seconds() / 3600,
+                            max_temp
+                        )
+                        submit_to_ledger("TransportCompleted", transport_summary)
+                        st.session_state.current_step = 6
 
-# Step 6: Retail Distribution
-elif st.session_state.current_step == 6:
-    st.header("🏪 Retail Distribution")
-    st.markdown("""
-    Products are distributed to retailers who verify the batch and record their receipt on blockchain.
-    """)
+    # Step 6: Retail Distribution
+    elif st.session_state.current_step == 6:
+        st.header("🏪 Retail Distribution")
+        st.markdown("""
+        Products are distributed to retailers who verify the batch and record their receipt on blockchain.
+        """)
     
-    if 'transport_data' not in st.session_state or st.session_state.transport_data.empty:
-        st.warning("Please complete Transport Tracking first")
-        st.button("Go to Step 5", on_click=lambda: setattr(st.session_state, 'current_step', 5))
-    else:
-        st.subheader("Retailer Distribution Network")
-        
-        if not st.session_state.retailers_data:
-            st.session_state.retailers_data = [
-                {"name": "FreshMart", "location": "Mumbai", "quantity": 0},
-                {"name": "Organic Bazaar", "location": "Pune", "quantity": 0},
-                {"name": "Farm2Table", "location": "Delhi", "quantity": 0}
-            ]
+        if 'transport_data' not in st.session_state or st.session_state.transport_data.empty:
+            st.warning("Please complete Transport Tracking first")
+            st.button("Go to Step 5", on_click=lambda: setattr(st.session_state, 'current_step', 5))
+        else:
+            st.subheader("Retailer Distribution Network")
         
-        col1, col2 = st.columns(2)
+            if not st.session_state.retailers_data:
+                st.session_state.retailers_data = [
+                    {"name": "FreshMart", "location": "Mumbai", "quantity": 0},
+                    {"name": "Organic Bazaar", "location": "Pune", "quantity": 0},
+                    {"name": "Farm2Table", "location": "Delhi", "quantity": 0}
+                ]
         
-        with col1:
-            st.subheader("Distribute to Retailers")
+            # Allocations live in the shared versioned store; mirror its latest snapshot
+            batch_key = record_key(st.session_state.harvest_data)
             total_quantity = int(st.session_state.harvest_data['Quantity'].replace('kg', ''))
-            distributed = sum(r['quantity'] for r in st.session_state.retailers_data)
-            remaining = total_quantity - distributed
+            try:
+                batch = inventory.open_batch(get_inventory(), batch_key, total_quantity)
+            except (inventory.OverAllocation, inventory.VersionConflict) as e:
+                # Keep distributing against the stored total rather than the re-recorded harvest
+                st.error(f"Batch quantity not updated: {e}")
+                batch = get_inventory().get(("batch", batch_key))
+                total_quantity = batch.value["TotalKg"]
+            for retailer in st.session_state.retailers_data:
+                retailer['quantity'] = batch.value["Allocations"].get(retailer['name'], 0)
+        
+            col1, col2 = st.columns(2)
+        
+            with col1:
+                st.subheader("Distribute to Retailers")
+                distributed = sum(r['quantity'] for r in st.session_state.retailers_data)
+                remaining = inventory.remaining_kg(batch)
             
-            st.metric("Total Batch Quantity", f"{total_quantity} kg")
-            st.metric("Already Distributed", f"{distributed} kg")
-            st.metric("Remaining Quantity", f"{remaining} kg")
+                st.metric("Total Batch Quantity", f"{total_quantity} kg")
+                st.metric("Already Distributed", f"{distributed} kg")
+                st.metric("Remaining Quantity", f"{remaining} kg")
             
-            st.progress(distributed / total_quantity)
+                st.progress(distributed / total_quantity)
             
-            if remaining > 0:
-                selected_retailer = st.selectbox(
-                    "Select Retailer", 
-                    [r['name'] for r in st.session_state.retailers_data],
-                    key="selected_retailer"
-                )
-                retailer_quantity = st.number_input(
-                    "Quantity (kg)", 
-                    min_value=1, 
-                    max_value=remaining, 
-                    key="retailer_quantity"
-                )
+                if remaining > 0:
+                    selected_retailer = st.selectbox(
+                        "Select Retailer", 
+                        [r['name'] for r in st.session_state.retailers_data],
+                        key="selected_retailer"
+                    )
+                    retailer_quantity = st.number_input(
+                        "Quantity (kg)", 
+                        min_value=1, 
+                        max_value=total_quantity, 
+                        key="retailer_quantity"
+                    )
                 
-                if st.button("Record Distribution"):
-                    for retailer in st.session_state.retailers_data:
-                        if retailer['name'] == selected_retailer:
-                            retailer['quantity'] += retailer_quantity
-                    
-                    st.success(f"Distributed {retailer_quantity}kg to {selected_retailer}")
-                    st.rerun()
+                    if st.button("Record Distribution"):
+                        try:
+                            # Checked against the latest remaining quantity, not the one rendered above,
+                            # and again on every conflict retry
+                            batch = inventory.allocate(get_inventory(), batch_key, selected_retailer, retailer_quantity)
+                        except inventory.OverAllocation as e:
+                            st.error(f"Distribution rejected: {e}")
+                        except inventory.VersionConflict:
+                            st.error("This batch is busy with other distributions; please record it again")
+                        else:
+                            for retailer in st.session_state.retailers_data:
+                                retailer['quantity'] = batch.value["Allocations"].get(retailer['name'], 0)
+                                if retailer['name'] == selected_retailer:
+                                    get_recall_index().record_allocation(
+                                        batch_key,
+                                        retailer['name'],
+                                        retailer['location'],
+                                        retailer_quantity
+                                    )
+                            get_analytics().record_allocation(selected_retailer, retailer_quantity)
+                        
+                            submit_to_ledger("RetailDistributed", {
+                                "BatchID": st.session_state.harvest_data.get("BlockchainTx", ""),
+                                "Retailer": selected_retailer,
+                                "Quantity": f"{retailer_quantity}kg"
+                            })
+                            st.success(f"Distributed {retailer_quantity}kg to {selected_retailer}")
+                            st.rerun()
         
-        with col2:
-            st.subheader("Distribution Records")
+            with col2:
+                st.subheader("Distribution Records")
             
-            distributed = sum(r['quantity'] for r in st.session_state.retailers_data)
-            if distributed > 0:
-                active_retailers = [r for r in st.session_state.retailers_data if r['quantity'] > 0]
+                distributed = sum(r['quantity'] for r in st.session_state.retailers_data)
+                if distributed > 0:
+                    active_retailers = [r for r in st.session_state.retailers_data if r['quantity'] > 0]
                 
-                if active_retailers:
-                    fig, ax = plt.subplots()
-                    ax.pie(
-                        [r['quantity'] for r in active_retailers],
-                        labels=[r['name'] for r in active_retailers],
-                        autopct='%1.1f%%',
-                        colors=['#4CAF50', '#8BC34A', '#CDDC39']
-                    )
-                    st.pyplot(fig)
+                    if active_retailers:
+                        with profiling.span("chart.retailer_pie"):
+                            fig, ax = plt.subplots()
+                            ax.pie(
+                                [r['quantity'] for r in active_retailers],
+                                labels=[r['name'] for r in active_retailers],
+                                autopct='%1.1f%%',
+                                colors=['#4CAF50', '#8BC34A', '#CDDC39']
+                            )
+                            st.pyplot(fig)
                     
-                    # Generate retailer QR codes
-                    for retailer in active_retailers:
-                        retailer_data = {
-                            "Retailer": retailer['name'],
-                            "Location": retailer['location'],
-                            "Quantity": f"{retailer['quantity']}kg",
-                            "BatchID": st.session_state.harvest_data.get("BlockchainTx", ""),
-                            "Farmer": st.session_state.farmer_data["Name"],
-                            "HarvestDate": st.session_state.harvest_data["Date"]
-                        }
+                        # Generate retailer QR codes
+                        for retailer in active_retailers:
+                            retailer_data = {
+                                "Retailer": retailer['name'],
+                                "Location": retailer['location'],
+                                "Quantity": f"{retailer['quantity']}kg",
+                                "BatchID": st.session_state.harvest_data.get("BlockchainTx", ""),
+                                "Farmer": st.session_state.farmer_data["Name"],
+                                "HarvestDate": st.session_state.harvest_data["Date"]
+                            }
                         
-                        st.image(
-                            generate_qr_code(retailer_data), 
-                            caption=f"{retailer['name']} QR", 
-                            width=150
-                        )
+                            st.image(
+                                generate_qr_code(retailer_data), 
+                                caption=f"{retailer['name']} QR", 
+                                width=150
+                            )
+                    else:
+                        st.info("No products distributed yet")
                 else:
                     st.info("No products distributed yet")
-            else:
-                st.info("No products distributed yet")
             
-            if remaining == 0 and st.button("Complete Distribution"):
-                st.session_state.current_step = 7
+                if remaining == 0 and st.button("Complete Distribution"):
+                    st.session_state.current_step = 7
 
-# Step 7: Consumer Purchase
-elif st.session_state.current_step == 7:
-    st.header("🛒 Consumer Purchase")
-    st.markdown("""
-    Consumers can scan the QR code to verify the product's journey from farm to store.
-    """)
+    # Step 7: Consumer Purchase
+    elif st.session_state.current_step == 7:
+        st.header("🛒 Consumer Purchase")
+        st.markdown("""
+        Consumers can scan the QR code to verify the product's journey from farm to store.
+        """)
     
-    if not st.session_state.retailers_data or sum(r['quantity'] for r in st.session_state.retailers_data) == 0:
-        st.warning("Please complete Retail Distribution first")
-        st.button("Go to Step 6", on_click=lambda: setattr(st.session_state, 'current_step', 6))
-    else:
-        st.subheader("Product Traceability")
+        if not st.session_state.retailers_data or sum(r['quantity'] for r in st.session_state.retailers_data) == 0:
+            st.warning("Please complete Retail Distribution first")
+            st.button("Go to Step 6", on_click=lambda: setattr(st.session_state, 'current_step', 6))
+        else:
+            st.subheader("Product Traceability")
         
-        col1, col2 = st.columns(2)
+            col1, col2 = st.columns(2)
         
-        with col1:
-            # Prepare final traceability data
-            traceability_data = {
-                "Product": st.session_state.harvest_data["Crop"],
-                "BatchID": st.session_state.harvest_data.get("BlockchainTx", ""),
-                "Farmer": {
-                    "Name": st.session_state.farmer_data["Name"],
-                    "ID": st.session_state.farmer_data["FarmerID"],
-                    "Location": st.session_state.farmer_data["Location"]["Village"]
-                },
-                "Seed": st.session_state.sowing_data["SeedPurchase"]["Batch"],
-                "Harvest": {
-                    "Date": st.session_state.harvest_data["Date"],
-                    "Quantity": st.session_state.harvest_data["Quantity"],
-                    "Quality": st.session_state.harvest_data["Quality"]
-                },
-                "Transport": {
-                    "From": st.session_state.farmer_data["Location"]["Village"],
-                    "To": "Mumbai",
-                    "Duration": "24 hours",
-                    "AvgTemp": f"{st.session_state.transport_data['Temperature (°C)'].mean():.1f}°C"
-                },
-                "Retailers": [
-                    {"Name": r["name"], "Quantity": r["quantity"]} 
-                    for r in st.session_state.retailers_data if r["quantity"] > 0
-                ],
-                "Blockchain": {
-                    "Transactions": [
-                        st.session_state.farmer_data["BlockchainTx"],
-                        st.session_state.sowing_data["SeedPurchase"]["BlockchainTx"],
-                        st.session_state.sowing_data["Sowing"]["BlockchainTx"],
-                        st.session_state.fertilizer_data["Purchase"]["BlockchainTx"],
-                        st.session_state.fertilizer_data["Application"]["BlockchainTx"],
-                        st.session_state.harvest_data["BlockchainTx"],
-                        st.session_state.harvest_data["Sale"]["BlockchainTx"]
-                    ]
+            with col1:
+                # Prepare final traceability data
+                traceability_data = {
+                    "ReportID": record_key(st.session_state.harvest_data).replace(":", "-"),
+                    "Product": st.session_state.harvest_data["Crop"],
+                    "BatchID": st.session_state.harvest_data.get("BlockchainTx", ""),
+                    "Farmer": {
+                        "Name": st.session_state.farmer_data["Name"],
+                        "ID": st.session_state.farmer_data["FarmerID"],
+                        "Location": st.session_state.farmer_data["Location"]["Village"]
+                    },
+                    "Seed": st.session_state.sowing_data["SeedPurchase"]["Batch"],
+                    "Harvest": {
+                        "Date": st.session_state.harvest_data["Date"],
+                        "Quantity": st.session_state.harvest_data["Quantity"],
+                        "Quality": st.session_state.harvest_data["Quality"]
+                    },
+                    "Transport": {
+                        "From": st.session_state.farmer_data["Location"]["Village"],
+                        "To": "Mumbai",
+                        "Duration": "24 hours",
+                        "AvgTemp": f"{st.session_state.transport_data['Temperature (°C)'].mean():.1f}°C"
+                    },
+                    "Retailers": [
+                        {"Name": r["name"], "Quantity": r["quantity"]} 
+                        for r in st.session_state.retailers_data if r["quantity"] > 0
+                    ],
+                    "Blockchain": {
+                        "Transactions": [
+                            st.session_state.farmer_data["BlockchainTx"],
+                            st.session_state.sowing_data["SeedPurchase"]["BlockchainTx"],
+                            st.session_state.sowing_data["Sowing"]["BlockchainTx"],
+                            st.session_state.fertilizer_data["Purchase"]["BlockchainTx"],
+                            st.session_state.fertilizer_data["Application"]["BlockchainTx"],
+                            st.session_state.harvest_data["BlockchainTx"],
+                            st.session_state.harvest_data["Sale"]["BlockchainTx"]
+                        ]
+                    }
                 }
-            }
             
-            # Generate QR code
-            try:
-                qr_img = generate_qr_code(traceability_data)
-                st.image(qr_img, width=300)
+                # Publish for the standalone verification service
+                verification_service.publish_report(traceability_data)
+            
+                # Generate QR code
+                try:
+                    # The QR carries only the report's URL; the service serves the full report
+                    verify_url = verification_service.verification_url(traceability_data["ReportID"])
+                    qr_img = generate_qr_code(verify_url)
+                    st.image(qr_img, width=300)
+                    st.caption(f"Verify online: {verify_url}")
                 
-                st.download_button(
-                    label="Download Traceability QR",
-                    data=qr_img,
-                    file_name="product_traceability_qr.png",
-                    mime="image/png"
-                )
-            except Exception as e:
-                st.error(f"Error generating QR code: {str(e)}")
-                st.warning("Showing simplified version due to data size")
-                st.json({
-                    "Product": traceability_data["Product"],
-                    "BatchID": traceability_data["BatchID"],
-                    "Farmer": traceability_data["Farmer"]["Name"],
-                    "HarvestDate": traceability_data["Harvest"]["Date"]
-                })
+                    st.download_button(
+                        label="Download Traceability QR",
+                        data=qr_img,
+                        file_name="product_traceability_qr.png",
+                        mime="image/png"
+                    )
+                except Exception as e:
+                    st.error(f"Error generating QR code: {str(e)}")
+                    st.warning("Showing simplified version due to data size")
+                    st.json({
+                        "Product": traceability_data["Product"],
+                        "BatchID": traceability_data["BatchID"],
+                        "Farmer": traceability_data["Farmer"]["Name"],
+                        "HarvestDate": traceability_data["Harvest"]["Date"]
+                    })
         
-        with col2:
-            st.subheader("Traceability Report")
-            
-            st.markdown(f"""
-            ### 🌾 Farm-to-Table Journey
-            **Product:** {traceability_data["Product"]}  
-            **Batch ID:** {traceability_data["BatchID"]}
-            
-            ### 👨‍🌾 Farmer Details
-            **Name:** {traceability_data["Farmer"]["Name"]}  
-            **ID:** {traceability_data["Farmer"]["ID"]}  
-            **Location:** {traceability_data["Farmer"]["Location"]}
-            
-            ### 🌱 Cultivation
-            **Seed Batch:** {traceability_data["Seed"]}  
-            **Organic Certified:** ✅ Yes  
-            **Fertilizer Used:** {st.session_state.fertilizer_data["Purchase"]["Type"]}
-            
-            ### 🚜 Harvest
-            **Date:** {traceability_data["Harvest"]["Date"]}  
-            **Quantity:** {traceability_data["Harvest"]["Quantity"]}  
-            **Quality Grade:** {traceability_data["Harvest"]["Quality"]}
-            
-            ### 🚚 Transport
-            **From:** {traceability_data["Transport"]["From"]}  
-            **To:** {traceability_data["Transport"]["To"]}  
-            **Duration:** {traceability_data["Transport"]["Duration"]}  
-            **Temperature:** {traceability_data["Transport"]["AvgTemp"]}
-            
-            ### 🏪 Retail Availability
-            """)
+            with col2:
+                st.subheader("Traceability Report")
             
-            for retailer in traceability_data["Retailers"]:
-                st.markdown(f"- {retailer['Name']}: {retailer['Quantity']}kg")
+                st.markdown(f"""
+                ### 🌾 Farm-to-Table Journey
+                **Product:** {traceability_data["Product"]}  
+                **Batch ID:** {traceability_data["BatchID"]}
             
-            st.markdown("""
-            ### 🔗 Blockchain Verification
-            All steps verified and recorded on blockchain
-            """)
+                ### 👨‍🌾 Farmer Details
+                **Name:** {traceability_data["Farmer"]["Name"]}  
+                **ID:** {traceability_data["Farmer"]["ID"]}  
+                **Location:** {traceability_data["Farmer"]["Location"]}
+            
+                ### 🌱 Cultivation
+                **Seed Batch:** {traceability_data["Seed"]}  
+                **Organic Certified:** ✅ Yes  
+                **Fertilizer Used:** {st.session_state.fertilizer_data["Purchase"]["Type"]}
+            
+                ### 🚜 Harvest
+                **Date:** {traceability_data["Harvest"]["Date"]}  
+                **Quantity:** {traceability_data["Harvest"]["Quantity"]}  
+                **Quality Grade:** {traceability_data["Harvest"]["Quality"]}
+            
+                ### 🚚 Transport
+                **From:** {traceability_data["Transport"]["From"]}  
+                **To:** {traceability_data["Transport"]["To"]}  
+                **Duration:** {traceability_data["Transport"]["Duration"]}  
+                **Temperature:** {traceability_data["Transport"]["AvgTemp"]}
+            
+                ### 🏪 Retail Availability
+                """)
+            
+                for retailer in traceability_data["Retailers"]:
+                    st.markdown(f"- {retailer['Name']}: {retailer['Quantity']}kg")
+            
+                st.markdown("""
+                ### 🔗 Blockchain Verification
+                All steps verified and recorded on blockchain
+                """)
         
-        st.divider()
-        st.subheader("Impact Metrics")
+            st.divider()
+            st.subheader("Retail Sales")
         
-        cols = st.columns(3)
-        cols[0].metric("Farmer Income", "₹25/kg", "+25% vs traditional")
-        cols[1].metric("Supply Chain Efficiency", "3 days", "60% faster")
-        cols[2].metric("Food Safety", "100% Traceable", "0 recalls")
+            # Sales are checked against what each retailer was allocated from this batch and has not sold yet
+            batch_key = record_key(st.session_state.harvest_data)
+            with st.form("retail_sale_form"):
+                sold_retailer = st.selectbox("Retailer", [r["Name"] for r in traceability_data["Retailers"]], key="sold_retailer")
+                sold_quantity = st.number_input("Quantity Sold (kg)", min_value=1, value=50, key="sold_quantity")
+                if st.form_submit_button("Record Retail Sale"):
+                    try:
+                        inventory.record_retail_sale(get_inventory(), batch_key, sold_retailer, sold_quantity)
+                    except (inventory.OverSold, KeyError) as e:
+                        st.error(f"Retail sale not recorded: {e}")
+                    except inventory.VersionConflict:
+                        st.error("This batch is being updated by other users; please record the sale again")
+                    else:
+                        get_analytics().record_retail_sale(sold_retailer, sold_quantity)
+                        submit_to_ledger("RetailSold", {
+                            "BatchID": traceability_data["BatchID"],
+                            "Retailer": sold_retailer,
+                            "Quantity": f"{sold_quantity}kg"
+                        })
+                        st.success(f"Recorded {sold_quantity}kg sold at {sold_retailer}")
+            batch = get_inventory().get(("batch", batch_key))
+            if batch is not None:
+                st.caption("Unsold: " + ", ".join(
+                    f"{r['Name']} {inventory.unsold_kg(batch, r['Name'])}kg" for r in traceability_data["Retailers"]
+                ))
+        
+            st.subheader("Impact Metrics")
+        
+            rollups = get_analytics()
+            crop = traceability_data["Product"]
+            district = st.session_state.farmer_data["Location"]["District"]
+            district_price = rollups.farmer_price(crop, district)
+            crop_price = rollups.farmer_price(crop)
+            route = rollups.route(traceability_data["Transport"]["From"], traceability_data["Transport"]["To"])
+            intensity = rollups.fertilizer_intensity(district)
+            sell_through = rollups.sell_through()
+        
+            cols = st.columns(4)
+            cols[0].metric(
+                f"Farmer Price ({district})",
+                f"₹{district_price:.1f}/kg" if district_price else "No sales",
+                f"{100 * (district_price / crop_price - 1):+.1f}% vs {crop} average" if district_price and crop_price else None
+            )
+            cols[1].metric(
+                "Transit Time",
+                f"{route['AvgTransitHours']:.1f} hours" if route else "No shipments",
+                f"{route['CompliancePct']:.0f}% cold-chain compliant" if route else None,
+                delta_color="off"
+            )
+            cols[2].metric("Fertilizer Intensity", f"{intensity:.1f} kg/acre" if intensity else "No applications")
+            cols[3].metric("Retail Sell-Through", f"{sell_through:.0f}%" if sell_through is not None else "No allocations")
+        
+            with st.expander("All Rollups"):
+                for title, table in zip(
+                    ["Farmer Price by Crop and District", "Transit and Cold Chain by Route",
+                     "Fertilizer Intensity by District", "Retailer Sell-Through"],
+                    rollups.tables().values()
+                ):
+                    st.markdown(f"**{title}**")
+                    st.dataframe(table.round(1), hide_index=True)
 
-# Show smart contract if requested
-if st.session_state.get('show_contract', False):
-    with st.expander("Smart Contract Code", expanded=True):
-        st.markdown("""
-        ```solidity
-        // SPDX-License-Identifier: MIT
-        pragma solidity ^0.8.0;
-        
-        contract FarmTraceability {
-            address public admin;
-            
-            struct Farmer {
-                string name;
-                string aadhaarHash;
-                string location;
-                string landCoordinates;
-                bool registered;
-            }
+    # Show smart contract if requested
+    if st.session_state.get('show_contract', False):
+        with st.expander("Smart Contract Code", expanded=True):
+            st.markdown("""
+            ```solidity
+            // SPDX-License-Identifier: MIT
+            pragma solidity ^0.8.0;
+        
+            contract FarmTraceability {
+                address public admin;
             
-            struct Batch {
-                string farmerId;
-                string seedBatch;
-                string fertilizerBatch;
-                uint256 harvestDate;
-                uint256 quantity;
-                string quality;
-                address buyer;
-                bool sold;
-            }
+                struct Farmer {
+                    string name;
+                    string aadhaarHash;
+                    string location;
+                    string landCoordinates;
+                    bool registered;
+                }
+            
+                struct Batch {
+                    string farmerId;
+                    string seedBatch;
+                    string fertilizerBatch;
+                    uint256 harvestDate;
+                    uint256 quantity;
+                    string quality;
+                    address buyer;
+                    bool sold;
+                }
             
-            mapping(string => Farmer) public farmers;
-            mapping(string => Batch) public batches;
+                mapping(string => Farmer) public farmers;
+                mapping(string => Batch) public batches;
             
-            event FarmerRegistered(string farmerId, string name);
-            event BatchCreated(string batchId, string farmerId);
-            event BatchSold(string batchId, address buyer);
+                event FarmerRegistered(string farmerId, string name);
+                event BatchCreated(string batchId, string farmerId);
+                event BatchSold(string batchId, address buyer);
             
-            constructor() {
-                admin = msg.sender;
-            }
+                constructor() {
+                    admin = msg.sender;
+                }
             
-            function registerFarmer(
-                string memory farmerId,
-                string memory name,
-                string memory aadhaarHash,
-                string memory location,
-                string memory landCoordinates
-            ) public {
-                require(msg.sender == admin, "Only admin can register farmers");
-                require(!farmers[farmerId].registered, "Farmer already registered");
+                function registerFarmer(
+                    string memory farmerId,
+                    string memory name,
+                    string memory aadhaarHash,
+                    string memory location,
+                    string memory landCoordinates
+                ) public {
+                    require(msg.sender == admin, "Only admin can register farmers");
+                    require(!farmers[farmerId].registered, "Farmer already registered");
                 
-                farmers[farmerId] = Farmer({
-                    name: name,
-                    aadhaarHash: aadhaarHash,
-                    location: location,
-                    landCoordinates: landCoordinates,
-                    registered: true
-                });
+                    farmers[farmerId] = Farmer({
+                        name: name,
+                        aadhaarHash: aadhaarHash,
+                        location: location,
+                        landCoordinates: landCoordinates,
+                        registered: true
+                    });
                 
-                emit FarmerRegistered(farmerId, name);
-            }
+                    emit FarmerRegistered(farmerId, name);
+                }
             
-            function createBatch(
-                string memory batchId,
-                string memory farmerId,
-                string memory seedBatch,
-                string memory fertilizerBatch,
-                uint256 harvestDate,
-                uint256 quantity,
-                string memory quality
-            ) public {
-                require(farmers[farmerId].registered, "Farmer not registered");
-                require(batches[batchId].harvestDate == 0, "Batch already exists");
+                function createBatch(
+                    string memory batchId,
+                    string memory farmerId,
+                    string memory seedBatch,
+                    string memory fertilizerBatch,
+                    uint256 harvestDate,
+                    uint256 quantity,
+                    string memory quality
+                ) public {
+                    require(farmers[farmerId].registered, "Farmer not registered");
+                    require(batches[batchId].harvestDate == 0, "Batch already exists");
                 
-                batches[batchId] = Batch({
-                    farmerId: farmerId,
-                    seedBatch: seedBatch,
-                    fertilizerBatch: fertilizerBatch,
-                    harvestDate: harvestDate,
-                    quantity: quantity,
-                    quality: quality,
-                    buyer: address(0),
-                    sold: false
-                });
+                    batches[batchId] = Batch({
+                        farmerId: farmerId,
+                        seedBatch: seedBatch,
+                        fertilizerBatch: fertilizerBatch,
+                        harvestDate: harvestDate,
+                        quantity: quantity,
+                        quality: quality,
+                        buyer: address(0),
+                        sold: false
+                    });
                 
-                emit BatchCreated(batchId, farmerId);
-            }
+                    emit BatchCreated(batchId, farmerId);
+                }
             
-            function purchaseBatch(string memory batchId) public payable {
-                require(batches[batchId].harvestDate != 0, "Batch doesn't exist");
-                require(!batches[batchId].sold, "Batch already sold");
+                function purchaseBatch(string memory batchId) public payable {
+                    require(batches[batchId].harvestDate != 0, "Batch doesn't exist");
+                    require(!batches[batchId].sold, "Batch already sold");
                 
-                // In a real contract, you would include payment logic here
-                batches[batchId].buyer = msg.sender;
-                batches[batchId].sold = true;
+                    // In a real contract, you would include payment logic here
+                    batches[batchId].buyer = msg.sender;
+                    batches[batchId].sold = true;
                 
-                emit BatchSold(batchId, msg.sender);
-            }
+                    emit BatchSold(batchId, msg.sender);
+                }
             
-            function getBatchDetails(string memory batchId) public view returns (
-                string memory farmerId,
-                string memory seedBatch,
-                string memory fertilizerBatch,
-                uint256 harvestDate,
-                uint256 quantity,
-                string memory quality,
-                address buyer,
-                bool sold
-            ) {
-                Batch memory batch = batches[batchId];
-                return (
-                    batch.farmerId,
-                    batch.seedBatch,
-                    batch.fertilizerBatch,
-                    batch.harvestDate,
-                    batch.quantity,
-                    batch.quality,
-                    batch.buyer,
-                    batch.sold
-                );
+                function getBatchDetails(string memory batchId) public view returns (
+                    string memory farmerId,
+                    string memory seedBatch,
+                    string memory fertilizerBatch,
+                    uint256 harvestDate,
+                    uint256 quantity,
+                    string memory quality,
+                    address buyer,
+                    bool sold
+                ) {
+                    Batch memory batch = batches[batchId];
+                    return (
+                        batch.farmerId,
+                        batch.seedBatch,
+                        batch.fertilizerBatch,
+                        batch.harvestDate,
+                        batch.quantity,
+                        batch.quality,
+                        batch.buyer,
+                        batch.sold
+                    );
+                }
             }
-        }
-        ```
-        """)
-        st.button("Close", on_click=lambda: setattr(st.session_state, 'show_contract', False))
\ No newline at end of file
+            ```
+            """)
+            st.button("Close", on_click=lambda: setattr(st.session_state, 'show_contract', False))
+
+    # Ledger receipts for this session, rendered last so this run's submissions are included
+    if st.session_state.ledger_receipts:
+        with st.sidebar:
+            st.markdown("**Ledger Receipts**")
+            status_icons = {ledger.PENDING: "⏳", ledger.COMMITTED: "✅", ledger.FAILED: "❌"}
+            for tx_id in st.session_state.ledger_receipts[-10:]:
+                receipt = get_ledger().receipt(tx_id)
+                if receipt is not None:
+                    block = f" · block {receipt.block}" if receipt.block is not None else ""
+                    st.caption(f"{status_icons[receipt.status]} {receipt.kind} `{tx_id[:8]}`{block}")
+
+finally:
+    # Close the rerun span and fold this rerun's profiler samples into the session,
+    # also when st.rerun(), st.stop() or a newer rerun request cuts this run short
+    profiling.end(rerun_span)
+    if session_profiler is not None:
+        session_samples = st.session_state.setdefault("profile_samples", Counter())
+        session_samples.update(session_profiler.stop())
+
+if session_profiler is not None:
+    with st.expander("Profiler Samples (this session)"):
+        st.dataframe(pd.DataFrame(
+            profiling.top_frames(session_samples),
+            columns=["Frame", "Samples", "Share"]
+        ))
+        st.download_button(
+            label="Download Collapsed Stacks",
+            data=profiling.collapsed_stacks(session_samples),
+            file_name="session_profile.folded",
+            mime="text/plain"
+        )
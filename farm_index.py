@@ -0,0 +1,205 @@
+"""Spatial index and server-side clustering over registered farms.
+
+Farms are bucketed into a uniform lat/lon grid for radius and bounding-box
+queries, and into one aggregate per web-mercator cluster cell for every map
+zoom level. Both are maintained on registration, so drawing a map of tens
+of thousands of farms only reads the pre-aggregated clusters in view.
+
+    python farm_index.py --farms 50000
+"""
+import argparse
+import math
+import random
+import threading
+import time
+
+EARTH_RADIUS_KM = 6371.0088
+KM_PER_DEGREE = 111.32
+MIN_ZOOM, MAX_ZOOM = 3, 16
+# Cluster cells are 2**CLUSTER_SHIFT smaller than a 256px tile (~64px on screen)
+CLUSTER_SHIFT = 2
+
+
+def haversine_km(lat1, lon1, lat2, lon2):
+    lat1, lon1, lat2, lon2 = map(math.radians, (lat1, lon1, lat2, lon2))
+    h = math.sin((lat2 - lat1) / 2) ** 2 + math.cos(lat1) * math.cos(lat2) * math.sin((lon2 - lon1) / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * math.asin(math.sqrt(h))
+
+
+def _tile_xy(lat, lon, zoom):
+    # Web-mercator cell of (lat, lon) at ``zoom`` + CLUSTER_SHIFT
+    n = 2 ** (zoom + CLUSTER_SHIFT)
+    lat = max(min(lat, 85.0511), -85.0511)
+    x = int((lon + 180.0) / 360.0 * n)
+    y = int((1.0 - math.asinh(math.tan(math.radians(lat))) / math.pi) / 2.0 * n)
+    return min(x, n - 1), min(y, n - 1)
+
+
+def viewport_bbox(lat, lon, zoom, width_px=700, height_px=500):
+    # Approximate (south, west, north, east) shown by a map of the given pixel size
+    deg_per_px = 360.0 / (256 * 2 ** zoom)
+    half_w = width_px / 2 * deg_per_px
+    half_h = height_px / 2 * deg_per_px * math.cos(math.radians(lat))
+    return lat - half_h, lon - half_w, lat + half_h, lon + half_w
+
+
+class FarmIndex:
+    def __init__(self, cell_degrees=0.05):
+        self.cell = cell_degrees
+        self.farms = {}
+        self._grid = {}
+        self._districts = {}
+        self._clusters = {zoom: {} for zoom in range(MIN_ZOOM, MAX_ZOOM + 1)}
+        self._lock = threading.RLock()
+
+    def __len__(self):
+        return len(self.farms)
+
+    def _cell(self, lat, lon):
+        return int(math.floor(lat / self.cell)), int(math.floor(lon / self.cell))
+
+    def add(self, farm_id, lat, lon, district=None, **attrs):
+        """Register (or move) a farm; extra keyword attributes are kept for display."""
+        with self._lock:
+            if farm_id in self.farms:
+                self._remove(farm_id)
+            farm = {"FarmerID": farm_id, "lat": lat, "lon": lon, "District": district, **attrs}
+            self.farms[farm_id] = farm
+            self._grid.setdefault(self._cell(lat, lon), set()).add(farm_id)
+            if district:
+                self._districts.setdefault(district.strip().lower(), set()).add(farm_id)
+            for zoom, cells in self._clusters.items():
+                agg = cells.setdefault(_tile_xy(lat, lon, zoom), [0, 0.0, 0.0])
+                agg[0] += 1
+                agg[1] += lat
+                agg[2] += lon
+
+    def add_new(self, new_id, lat, lon, district=None, attempts=100, **attrs):
+        """Register a farm under the first unused id drawn from ``new_id()``; returns the id.
+
+        Drawing and adding happen under one lock, so concurrent registrations
+        never claim the same id. Raises RuntimeError if every draw is taken.
+        """
+        with self._lock:
+            for _ in range(attempts):
+                farm_id = new_id()
+                if farm_id not in self.farms:
+                    self.add(farm_id, lat, lon, district, **attrs)
+                    return farm_id
+        raise RuntimeError(f"no unused farm id in {attempts} draws")
+
+    def remove(self, farm_id):
+        with self._lock:
+            self._remove(farm_id)
+
+    def _remove(self, farm_id):
+        farm = self.farms.pop(farm_id, None)
+        if farm is None:
+            return
+        lat, lon = farm["lat"], farm["lon"]
+        self._grid[self._cell(lat, lon)].discard(farm_id)
+        if farm["District"]:
+            self._districts[farm["District"].strip().lower()].discard(farm_id)
+        for zoom, cells in self._clusters.items():
+            key = _tile_xy(lat, lon, zoom)
+            agg = cells[key]
+            agg[0] -= 1
+            agg[1] -= lat
+            agg[2] -= lon
+            if agg[0] == 0:
+                del cells[key]
+
+    def within_bbox(self, south, west, north, east):
+        (i0, j0), (i1, j1) = self._cell(south, west), self._cell(north, east)
+        found = []
+        with self._lock:
+            if (i1 - i0 + 1) * (j1 - j0 + 1) > len(self._grid):
+                # More cells in the box than populated: scan the populated ones instead of probing the box
+                cells = [ids for (i, j), ids in self._grid.items() if i0 <= i <= i1 and j0 <= j <= j1]
+            else:
+                cells = [self._grid.get((i, j), ()) for i in range(i0, i1 + 1) for j in range(j0, j1 + 1)]
+            for ids in cells:
+                for farm_id in ids:
+                    farm = self.farms[farm_id]
+                    if south <= farm["lat"] <= north and west <= farm["lon"] <= east:
+                        found.append(farm)
+        return found
+
+    def within_radius(self, lat, lon, radius_km):
+        """Farms within ``radius_km`` of a point, nearest first, with their distance."""
+        dlat = radius_km / KM_PER_DEGREE
+        dlon = radius_km / (KM_PER_DEGREE * max(math.cos(math.radians(lat)), 1e-6))
+        found = []
+        for farm in self.within_bbox(lat - dlat, lon - dlon, lat + dlat, lon + dlon):
+            distance = haversine_km(lat, lon, farm["lat"], farm["lon"])
+            if distance <= radius_km:
+                found.append({**farm, "DistanceKm": round(distance, 3)})
+        return sorted(found, key=lambda f: f["DistanceKm"])
+
+    def in_district(self, district):
+        with self._lock:
+            return [self.farms[f] for f in self._districts.get(district.strip().lower(), ())]
+
+    def clusters(self, zoom, bbox=None):
+        """Pre-aggregated clusters at ``zoom``: centroid and farm count.
+
+        Single-farm clusters also carry the farm itself under ``"farm"``.
+        """
+        zoom = max(MIN_ZOOM, min(MAX_ZOOM, zoom))
+        cells = self._clusters[zoom]
+        with self._lock:
+            keys = cells.keys()
+            if bbox is not None:
+                south, west, north, east = bbox
+                (x0, y0), (x1, y1) = _tile_xy(north, west, zoom), _tile_xy(south, east, zoom)
+                if (x1 - x0 + 1) * (y1 - y0 + 1) < len(cells):
+                    # Fewer cells in view than populated: probe the view instead of scanning
+                    keys = [(x, y) for x in range(x0, x1 + 1) for y in range(y0, y1 + 1) if (x, y) in cells]
+            aggregates = [tuple(cells[key]) for key in keys]
+        result = []
+        for count, sum_lat, sum_lon in aggregates:
+            lat, lon = sum_lat / count, sum_lon / count
+            if bbox is not None and not (south <= lat <= north and west <= lon <= east):
+                continue
+            cluster = {"lat": lat, "lon": lon, "count": count}
+            if count == 1:
+                # The centroid of a lone farm is the farm's own position
+                match = self.within_bbox(lat - 1e-9, lon - 1e-9, lat + 1e-9, lon + 1e-9)
+                cluster["farm"] = match[0] if match else None
+            result.append(cluster)
+        return result
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark farm index queries and clustering")
+    parser.add_argument("--farms", type=int, default=50000)
+    parser.add_argument("--seed", type=int, default=7)
+    args = parser.parse_args(argv)
+
+    rng = random.Random(args.seed)
+    districts = ["Uttarkashi", "Dehradun", "Tehri", "Chamoli", "Pauri", "Almora", "Nainital", "Pithoragarh"]
+    index = FarmIndex()
+    started = time.perf_counter()
+    for n in range(args.farms):
+        index.add(f"FARM{n}", rng.uniform(29.0, 31.3), rng.uniform(77.6, 81.0), district=rng.choice(districts))
+    print(f"indexed {args.farms} farms in {time.perf_counter() - started:.2f}s")
+
+    queries = 1000
+    started = time.perf_counter()
+    hits = sum(len(index.within_radius(rng.uniform(29.2, 31.1), rng.uniform(77.8, 80.8), 5.0)) for _ in range(queries))
+    print(f"5 km radius: {(time.perf_counter() - started) / queries * 1000:.3f} ms/query, {hits / queries:.1f} farms on average")
+
+    started = time.perf_counter()
+    in_district = len(index.in_district("Uttarkashi"))
+    print(f"district lookup: {(time.perf_counter() - started) * 1000:.3f} ms, {in_district} farms")
+
+    for zoom in (5, 8, 11, 14):
+        bbox = viewport_bbox(30.2, 79.3, zoom)
+        started = time.perf_counter()
+        clusters = index.clusters(zoom, bbox)
+        print(f"zoom {zoom:>2}: {len(clusters)} clusters in view covering {sum(c['count'] for c in clusters)} farms, "
+              f"{(time.perf_counter() - started) * 1000:.2f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,237 @@
+"""Versioned batch records with optimistic concurrency control.
+
+Every record is an immutable ``Versioned(value, version)`` snapshot. Readers
+take the current snapshot without locking; writers compute a new value from
+the snapshot they read and install it with a compare-and-swap that only
+succeeds if the version is unchanged, retrying from a fresh snapshot on
+conflict. The CAS itself holds one of ``stripes`` locks picked by key hash,
+so writers to different batches never wait on each other and writers to the
+same hot batch hold a lock only for the version check.
+
+Retail allocations and sales are built on this: an allocation is re-checked
+against the batch's remaining quantity on every retry, and a sale is a
+create-only write, so a batch can be neither over-allocated nor sold twice.
+Retail sales are checked the same way against each retailer's allocation.
+
+    python inventory.py --threads 8 --allocations 20000
+"""
+import argparse
+import random
+import sys
+import threading
+import time
+from collections import namedtuple
+
+Versioned = namedtuple("Versioned", ["value", "version"])
+
+
+class VersionConflict(RuntimeError):
+    pass
+
+
+class OverAllocation(ValueError):
+    pass
+
+
+class OverSold(ValueError):
+    pass
+
+
+class AlreadySold(ValueError):
+    def __init__(self, sale):
+        super().__init__(f"batch already sold to {sale.get('Buyer', 'another buyer')}")
+        self.sale = sale
+
+
+class VersionedStore:
+    def __init__(self, stripes=64, max_retries=100):
+        self._records = {}
+        self._locks = [threading.Lock() for _ in range(stripes)]
+        self._conflicts = [0] * stripes
+        self.max_retries = max_retries
+
+    def _stripe(self, key):
+        return hash(key) % len(self._locks)
+
+    def get(self, key):
+        # Current snapshot, or None; a plain dict read, no lock
+        return self._records.get(key)
+
+    def compare_and_swap(self, key, expected_version, value):
+        """Install ``value`` if ``key`` is still at ``expected_version`` (0 = absent)."""
+        stripe = self._stripe(key)
+        with self._locks[stripe]:
+            current = self._records.get(key)
+            version = current.version if current else 0
+            if version != expected_version:
+                self._conflicts[stripe] += 1
+                raise VersionConflict(f"{key!r} is at version {version}, expected {expected_version}")
+            record = Versioned(value, version + 1)
+            self._records[key] = record
+            return record
+
+    def update(self, key, fn):
+        """Optimistically apply ``fn(current_value_or_None) -> new_value``.
+
+        On conflict ``fn`` is re-run against the newer snapshot, so any check
+        it makes (and raises on) always sees the state it is replacing.
+        """
+        for attempt in range(self.max_retries + 1):
+            current = self._records.get(key)
+            value = fn(current.value if current else None)
+            try:
+                return self.compare_and_swap(key, current.version if current else 0, value)
+            except VersionConflict:
+                if attempt >= 4:
+                    # Back off a little once contention is clearly sustained
+                    time.sleep(random.uniform(0, 1e-6 * 2 ** min(attempt, 12)))
+        raise VersionConflict(f"{key!r}: gave up after {self.max_retries} retries")
+
+    def ensure(self, key, value):
+        # Create ``key`` with ``value`` unless it exists; returns the current snapshot
+        try:
+            return self.compare_and_swap(key, 0, value)
+        except VersionConflict:
+            return self._records[key]
+
+    def conflicts(self):
+        return sum(self._conflicts)
+
+
+def open_batch(store, batch_id, total_kg):
+    """Start tracking retail allocation of a harvest batch, or bring its total up to date.
+
+    A re-recorded harvest changes ``TotalKg``, but never to less than is
+    already allocated (raises OverAllocation and leaves the batch as it was).
+    """
+    def apply(batch):
+        if batch is None:
+            return {"TotalKg": total_kg, "Allocations": {}, "Sold": {}}
+        allocated = sum(batch["Allocations"].values())
+        if total_kg < allocated:
+            raise OverAllocation(f"{allocated}kg of batch {batch_id} is already allocated, more than {total_kg}kg")
+        return {**batch, "TotalKg": total_kg}
+    current = store.get(("batch", batch_id))
+    if current is not None and current.value["TotalKg"] == total_kg:
+        # The usual case, on every render: nothing to write
+        return current
+    return store.update(("batch", batch_id), apply)
+
+
+def remaining_kg(record):
+    return record.value["TotalKg"] - sum(record.value["Allocations"].values())
+
+
+def allocate(store, batch_id, retailer, quantity_kg):
+    """Allocate ``quantity_kg`` of a batch to ``retailer``; raises OverAllocation."""
+    def apply(batch):
+        if batch is None:
+            raise KeyError(f"batch {batch_id!r} is not open for distribution")
+        remaining = batch["TotalKg"] - sum(batch["Allocations"].values())
+        if quantity_kg > remaining:
+            raise OverAllocation(f"only {remaining}kg of batch {batch_id} left to allocate")
+        allocations = dict(batch["Allocations"])
+        allocations[retailer] = allocations.get(retailer, 0) + quantity_kg
+        return {**batch, "Allocations": allocations}
+    return store.update(("batch", batch_id), apply)
+
+
+def unsold_kg(record, retailer):
+    return record.value["Allocations"].get(retailer, 0) - record.value["Sold"].get(retailer, 0)
+
+
+def record_retail_sale(store, batch_id, retailer, quantity_kg):
+    """Record ``quantity_kg`` of a batch sold at ``retailer``; raises OverSold past its allocation."""
+    def apply(batch):
+        if batch is None:
+            raise KeyError(f"batch {batch_id!r} is not open for distribution")
+        unsold = batch["Allocations"].get(retailer, 0) - batch["Sold"].get(retailer, 0)
+        if quantity_kg > unsold:
+            raise OverSold(f"only {unsold}kg of batch {batch_id} left unsold at {retailer}")
+        sold = dict(batch["Sold"])
+        sold[retailer] = sold.get(retailer, 0) + quantity_kg
+        return {**batch, "Sold": sold}
+    return store.update(("batch", batch_id), apply)
+
+
+def record_sale(store, batch_id, sale):
+    """Record the one sale of a batch; raises AlreadySold if it was sold first."""
+    try:
+        return store.compare_and_swap(("sale", batch_id), 0, dict(sale))
+    except VersionConflict:
+        raise AlreadySold(store.get(("sale", batch_id)).value) from None
+
+
+def sale_of(store, batch_id):
+    record = store.get(("sale", batch_id))
+    return record.value if record else None
+
+
+def _contend(store, batch_ids, threads, allocations, quantity_kg=1):
+    # ``threads`` workers allocate round-robin over ``batch_ids`` until each has made its share
+    retailers = ["FreshMart", "Organic Bazaar", "Farm2Table"]
+    rejected = [0] * threads
+    barrier = threading.Barrier(threads)
+
+    def worker(n):
+        barrier.wait()
+        for i in range(allocations // threads):
+            try:
+                allocate(store, batch_ids[(n + i) % len(batch_ids)], retailers[i % 3], quantity_kg)
+            except OverAllocation:
+                rejected[n] += 1
+
+    pool = [threading.Thread(target=worker, args=(n,)) for n in range(threads)]
+    started = time.perf_counter()
+    for thread in pool:
+        thread.start()
+    for thread in pool:
+        thread.join()
+    return time.perf_counter() - started, sum(rejected)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark optimistic allocation under contention")
+    parser.add_argument("--threads", type=int, default=8)
+    parser.add_argument("--allocations", type=int, default=20000)
+    parser.add_argument("--switch-interval", type=float, default=1e-5,
+                        help="interpreter thread switch interval; small values force interleaving")
+    args = parser.parse_args(argv)
+    sys.setswitchinterval(args.switch_interval)
+    total = args.allocations // args.threads * args.threads
+
+    for label, n_batches, capacity in (("one hot batch", 1, total), ("100 batches", 100, total),
+                                        ("hot batch, oversubscribed 2x", 1, total // 2)):
+        store = VersionedStore()
+        batch_ids = [f"BATCH{n}" for n in range(n_batches)]
+        for batch_id in batch_ids:
+            open_batch(store, batch_id, capacity)
+        elapsed, rejected = _contend(store, batch_ids, args.threads, total)
+        allocated = sum(sum(store.get(("batch", b)).value["Allocations"].values()) for b in batch_ids)
+        over = [b for b in batch_ids if remaining_kg(store.get(("batch", b))) < 0]
+        print(f"{label:<30} {total / elapsed:>10,.0f} allocations/s on {args.threads} threads, "
+              f"{store.conflicts():>6} CAS conflicts retried, {rejected} rejected, "
+              f"{allocated} kg allocated, over-allocated batches: {len(over)}")
+
+    store = VersionedStore()
+    barrier = threading.Barrier(args.threads)
+    winners = []
+
+    def buyer(n):
+        barrier.wait()
+        try:
+            record_sale(store, "BATCH0", {"Buyer": f"BUYER{n}"})
+            winners.append(n)
+        except AlreadySold:
+            pass
+
+    pool = [threading.Thread(target=buyer, args=(n,)) for n in range(args.threads)]
+    for thread in pool:
+        thread.start()
+    for thread in pool:
+        thread.join()
+    print(f"{args.threads} concurrent sales of one batch: {len(winners)} recorded, sold to {sale_of(store, 'BATCH0')['Buyer']}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,205 @@
+"""Asynchronous, batched ledger submission.
+
+The Streamlit script thread hands records to ``LedgerClient.submit`` and gets
+a pending ``Receipt`` back immediately. An asyncio loop on a background
+thread groups submissions from every session into batches, sends them
+through the endorse/order/commit round trip and flips each receipt to
+committed (or failed) when the batch settles, so page latency does not
+depend on chain latency.
+
+``LocalOrderer`` stands in for a Fabric ordering service, with configurable
+latency and failure injection.
+"""
+import argparse
+import asyncio
+import dataclasses
+import hashlib
+import json
+import random
+import threading
+import time
+import uuid
+
+PENDING = "pending"
+COMMITTED = "committed"
+FAILED = "failed"
+
+
+class OrdererError(RuntimeError):
+    pass
+
+
+@dataclasses.dataclass
+class Receipt:
+    tx_id: str
+    kind: str
+    payload_hash: str
+    status: str = PENDING
+    submitted_at: float = dataclasses.field(default_factory=time.time)
+    committed_at: float = None
+    block: int = None
+    attempts: int = 0
+    error: str = None
+
+    @property
+    def latency(self):
+        if self.committed_at is None:
+            return None
+        return self.committed_at - self.submitted_at
+
+
+class LocalOrderer:
+    """In-process stand-in for endorse/order/commit.
+
+    Each batch takes ``latency`` seconds (plus up to ``jitter``) and fails
+    with probability ``failure_rate``.
+    """
+
+    def __init__(self, latency=0.3, jitter=0.1, failure_rate=0.0, seed=None):
+        self.latency = latency
+        self.jitter = jitter
+        self.failure_rate = failure_rate
+        self._rng = random.Random(seed)
+        self.height = 0
+
+    async def commit(self, batch):
+        await asyncio.sleep(self.latency + self._rng.uniform(0, self.jitter))
+        if self._rng.random() < self.failure_rate:
+            raise OrdererError("endorsement policy not satisfied")
+        self.height += 1
+        return self.height
+
+
+class LedgerClient:
+    def __init__(self, orderer=None, max_batch=100, max_wait=0.05, max_inflight=8, max_retries=2,
+                 max_receipts=100_000):
+        self.orderer = orderer or LocalOrderer()
+        self.max_batch = max_batch
+        self.max_wait = max_wait
+        self.max_inflight = max_inflight
+        self.max_retries = max_retries
+        self.max_receipts = max_receipts
+        self.receipts = {}
+        # Receipts by status since start, kept as receipts settle so stats() is O(1) and survives _trim
+        self._counts = {PENDING: 0, COMMITTED: 0, FAILED: 0}
+        self._counts_lock = threading.Lock()
+        self._loop = None
+        self._queue = None
+        self._started = threading.Event()
+
+    def start(self):
+        thread = threading.Thread(target=self._run, name="ledger-submitter", daemon=True)
+        thread.start()
+        self._started.wait()
+        return self
+
+    def _run(self):
+        self._loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(self._loop)
+        self._queue = asyncio.Queue()
+        self._loop.create_task(self._batcher())
+        self._started.set()
+        self._loop.run_forever()
+
+    def submit(self, kind, payload):
+        """Queue ``payload`` for the ledger and return its pending receipt."""
+        body = json.dumps(payload, sort_keys=True, default=str).encode()
+        receipt = Receipt(tx_id=uuid.uuid4().hex, kind=kind, payload_hash=hashlib.sha256(body).hexdigest())
+        self.receipts[receipt.tx_id] = receipt
+        with self._counts_lock:
+            self._counts[PENDING] += 1
+        self._loop.call_soon_threadsafe(self._queue.put_nowait, receipt)
+        return receipt
+
+    def receipt(self, tx_id):
+        return self.receipts.get(tx_id)
+
+    def stats(self):
+        with self._counts_lock:
+            return dict(self._counts)
+
+    def _settle(self, batch, status):
+        with self._counts_lock:
+            self._counts[PENDING] -= len(batch)
+            self._counts[status] += len(batch)
+
+    async def _batcher(self):
+        inflight = asyncio.Semaphore(self.max_inflight)
+        while True:
+            batch = [await self._queue.get()]
+            deadline = self._loop.time() + self.max_wait
+            while len(batch) < self.max_batch:
+                timeout = deadline - self._loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(self._queue.get(), timeout))
+                except asyncio.TimeoutError:
+                    break
+            await inflight.acquire()
+            task = self._loop.create_task(self._commit(batch))
+            task.add_done_callback(lambda _: inflight.release())
+
+    async def _commit(self, batch):
+        for attempt in range(1, self.max_retries + 2):
+            for receipt in batch:
+                receipt.attempts = attempt
+            try:
+                block = await self.orderer.commit(batch)
+            except OrdererError as e:
+                if attempt <= self.max_retries:
+                    await asyncio.sleep(0.05 * 2 ** attempt)
+                    continue
+                for receipt in batch:
+                    receipt.status = FAILED
+                    receipt.error = str(e)
+                self._settle(batch, FAILED)
+                return
+            now = time.time()
+            for receipt in batch:
+                receipt.block = block
+                receipt.committed_at = now
+                receipt.status = COMMITTED
+            self._settle(batch, COMMITTED)
+            self._trim()
+            return
+
+    def _trim(self):
+        # Forget the oldest receipts once the lookup table is full
+        while len(self.receipts) > self.max_receipts:
+            self.receipts.pop(next(iter(self.receipts)))
+
+    def wait(self, receipts, timeout=10.0):
+        # Block until the given receipts settle; for scripts and benchmarks, not the UI
+        deadline = time.monotonic() + timeout
+        while any(r.status == PENDING for r in receipts):
+            if time.monotonic() > deadline:
+                return False
+            time.sleep(0.01)
+        return True
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Submit a burst of transactions through the local orderer")
+    parser.add_argument("--transactions", type=int, default=5000)
+    parser.add_argument("--latency", type=float, default=0.3, help="orderer round trip in seconds")
+    parser.add_argument("--failure-rate", type=float, default=0.05)
+    parser.add_argument("--max-batch", type=int, default=100)
+    args = parser.parse_args()
+
+    client = LedgerClient(LocalOrderer(args.latency, failure_rate=args.failure_rate, seed=1),
+                          max_batch=args.max_batch).start()
+    started = time.perf_counter()
+    receipts = [client.submit("Benchmark", {"n": n}) for n in range(args.transactions)]
+    submit_time = time.perf_counter() - started
+    client.wait(receipts, timeout=600)
+    settle_time = time.perf_counter() - started
+    latencies = sorted(r.latency for r in receipts if r.latency is not None)
+    print(f"submit: {submit_time / args.transactions * 1e6:.1f} µs per transaction (caller-side)")
+    print(f"settled {args.transactions} in {settle_time:.2f}s over {client.orderer.height} blocks: {client.stats()}")
+    if latencies:
+        print(f"commit latency p50 {latencies[len(latencies) // 2]:.3f}s, max {latencies[-1]:.3f}s")
+
+
+if __name__ == "__main__":
+    main()
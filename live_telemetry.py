@@ -0,0 +1,157 @@
+"""Live sensor feed for the transport dashboard.
+
+``LiveFeed`` releases a simulated shipment's readings one at a time on a
+wall-clock schedule, as a truck's logger would upload them. Each ``poll``
+folds only the readings that arrived since the previous poll into
+``RunningStats``, so a dashboard tick costs the same whether the shipment
+has ten readings or ten thousand. The chart is redrawn from a bounded
+window of the latest ``WINDOW_READINGS`` readings on each tick, so what a
+tick sends to the browser is capped too.
+
+    python live_telemetry.py --trucks 50 --readings 288
+"""
+import argparse
+import time
+
+import numpy as np
+
+from transport_simulator import SAFE_MAX_TEMP, simulate_fleet, to_frame
+
+# Readings kept for the live chart
+WINDOW_READINGS = 48
+
+
+class RunningStats:
+    """Count, means, peak and excursions of a reading stream, updated per batch."""
+
+    def __init__(self, threshold=SAFE_MAX_TEMP):
+        self.threshold = threshold
+        self.count = 0
+        self.temp_count = 0
+        self.temp_sum = 0.0
+        self.humidity_count = 0
+        self.humidity_sum = 0.0
+        self.max_temp = None
+        self.excursions = 0
+        self.first = None
+        self.last = None
+
+    def update(self, timestamps, temps, humidity):
+        # Fold in one batch of readings (numpy arrays, in time order)
+        if not len(timestamps):
+            return self
+        measured = temps[~np.isnan(temps)]
+        self.count += len(timestamps)
+        self.temp_count += measured.size
+        self.temp_sum += float(measured.sum())
+        self.humidity_count += int(np.count_nonzero(~np.isnan(humidity)))
+        self.humidity_sum += float(np.nansum(humidity))
+        if measured.size:
+            peak = float(measured.max())
+            self.max_temp = peak if self.max_temp is None else max(self.max_temp, peak)
+            self.excursions += int(np.count_nonzero(measured > self.threshold))
+        if self.first is None:
+            self.first = timestamps[0]
+        self.last = timestamps[-1]
+        return self
+
+    @property
+    def mean_temp(self):
+        return self.temp_sum / self.temp_count if self.temp_count else None
+
+    @property
+    def mean_humidity(self):
+        return self.humidity_sum / self.humidity_count if self.humidity_count else None
+
+    @property
+    def transit_hours(self):
+        return float((self.last - self.first) / np.timedelta64(1, "s")) / 3600 if self.count else 0.0
+
+
+class LiveFeed:
+    """Release ``readings`` one every ``interval`` seconds, starting with the first."""
+
+    def __init__(self, shipment_id, readings, interval=2.0, window=WINDOW_READINGS, clock=time.monotonic):
+        self.shipment_id = shipment_id
+        self.readings = readings.reset_index(drop=True)
+        self.interval = interval
+        self.window_size = window
+        self.clock = clock
+        self.started = clock()
+        self.cursor = 0
+        self.stats = RunningStats()
+        self._timestamps = self.readings["Timestamp"].to_numpy()
+        self._temps = self.readings["Temperature (°C)"].to_numpy(dtype=float)
+        self._humidity = self.readings["Humidity (%)"].to_numpy(dtype=float)
+
+    def __len__(self):
+        return len(self.readings)
+
+    def available(self):
+        return min(len(self.readings), 1 + int((self.clock() - self.started) / self.interval))
+
+    @property
+    def done(self):
+        return self.cursor >= len(self.readings)
+
+    def poll(self):
+        # Fold in the readings that arrived since the last poll; returns how many
+        start, end = self.cursor, self.available()
+        if end > start:
+            self.stats.update(self._timestamps[start:end], self._temps[start:end], self._humidity[start:end])
+            self.cursor = end
+        return end - start
+
+    def window(self):
+        # The most recent readings received, for the chart
+        return self.readings.iloc[max(0, self.cursor - self.window_size):self.cursor]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Compare incremental live ticks with full recomputation")
+    parser.add_argument("--trucks", type=int, default=50)
+    parser.add_argument("--readings", type=int, default=288, help="readings per truck over the run")
+    parser.add_argument("--seed", type=int, default=9)
+    args = parser.parse_args(argv)
+
+    chunk = next(simulate_fleet(args.trucks, 1, args.readings, seed=args.seed, chunk_shipments=args.trucks,
+                                freq_seconds=86400 // args.readings))
+    frame = to_frame(chunk)
+    columns = ["Timestamp", "Temperature (°C)", "Humidity (%)"]
+    series = [frame.loc[frame["Shipment"] == s, columns] for s in chunk["shipment"]]
+
+    # A fake clock that advances one reading per tick
+    now = [0.0]
+    feeds = [LiveFeed(s, readings, interval=1.0, clock=lambda: now[0]) for s, readings in enumerate(series)]
+    incremental = full = 0.0
+    for tick in range(args.readings):
+        now[0] = float(tick)
+        started = time.perf_counter()
+        for feed in feeds:
+            feed.poll()
+            feed.window()
+        incremental += time.perf_counter() - started
+
+        started = time.perf_counter()
+        for readings in series:
+            # What a full rerun does: recompute every metric from all readings received so far
+            received = readings.iloc[:tick + 1]
+            received["Temperature (°C)"].mean()
+            received["Temperature (°C)"].max()
+            received["Humidity (%)"].mean()
+            received["Timestamp"].iloc[-1] - received["Timestamp"].iloc[0]
+            received.tail(WINDOW_READINGS)
+        full += time.perf_counter() - started
+
+    print(f"{args.trucks} trucks x {args.readings} ticks")
+    print(f"incremental: {incremental / args.readings * 1000:.2f} ms per tick for the fleet")
+    print(f"recompute from all received readings: {full / args.readings * 1000:.2f} ms per tick")
+    stats = feeds[0].stats
+    assert abs(stats.mean_temp - series[0]["Temperature (°C)"].mean()) < 1e-9
+    assert stats.max_temp == series[0]["Temperature (°C)"].max()
+    print(f"truck 0: {stats.count} readings, mean {stats.mean_temp:.2f}°C, peak {stats.max_temp:.2f}°C, "
+          f"{stats.excursions} above {SAFE_MAX_TEMP}°C")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,376 @@
+"""Concurrent end-to-end load harness for the traceability app.
+
+Starts one ``streamlit run`` server (or targets an already running one with
+``--url``) and drives N simulated field-agent sessions through all seven
+steps, farmer registration to consumer purchase, as headless websocket
+clients speaking Streamlit's browser protocol. Up to ``--concurrency``
+sessions are in flight at once against that single server, so they share
+its script threads, cached resources (ledger, indexes, inventory) and
+memory exactly as real users would. Reports per-step latency percentiles
+as seen by the client, script run counts and server memory growth.
+
+    python load_harness.py --sessions 200 --concurrency 8
+"""
+import argparse
+import asyncio
+import json
+import math
+import os
+import socket
+import subprocess
+import sys
+import time
+import urllib.request
+from pathlib import Path
+
+from streamlit.proto.BackMsg_pb2 import BackMsg
+from streamlit.proto.ForwardMsg_pb2 import ForwardMsg
+from streamlit.proto.WidgetStates_pb2 import WidgetState
+from tornado.websocket import websocket_connect
+
+APP_PATH = Path(__file__).with_name("apple_supply_chain_new.py")
+
+STEP_NAMES = {
+    1: "farmer_registration",
+    2: "sowing_inputs",
+    3: "growth_monitoring",
+    4: "harvest_sale",
+    5: "transport",
+    6: "retail_distribution",
+    7: "consumer_purchase",
+}
+
+# Retail allocations made in step 6; they must add up to the default 500kg harvest
+DEFAULT_ALLOCATIONS = [("FreshMart", 200), ("Organic Bazaar", 300)]
+
+
+class SessionError(RuntimeError):
+    pass
+
+
+def _rss_bytes(pid):
+    # Resident set size of the server process, or None where /proc is unavailable
+    try:
+        with open(f"/proc/{pid}/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError):
+        return None
+
+
+def _free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def start_server(port=0, startup_timeout=60):
+    """Launch the app under ``streamlit run`` and wait until it is healthy."""
+    port = port or _free_port()
+    server = subprocess.Popen(
+        [sys.executable, "-m", "streamlit", "run", str(APP_PATH),
+         "--server.headless", "true", "--server.address", "127.0.0.1", "--server.port", str(port),
+         "--server.fileWatcherType", "none", "--browser.gatherUsageStats", "false"],
+        stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    base_url = f"http://127.0.0.1:{port}"
+    deadline = time.monotonic() + startup_timeout
+    while time.monotonic() < deadline:
+        if server.poll() is not None:
+            raise SessionError(f"streamlit exited with code {server.returncode}")
+        try:
+            with urllib.request.urlopen(f"{base_url}/_stcore/health", timeout=1) as response:
+                if response.read() == b"ok":
+                    return server, base_url
+        except OSError:
+            pass
+        time.sleep(0.2)
+    server.terminate()
+    raise SessionError(f"streamlit did not become healthy within {startup_timeout}s")
+
+
+class _Session:
+    """One browser tab: a websocket to the server plus the widget values it sends."""
+
+    def __init__(self, base_url, timeout):
+        self.url = base_url.replace("http", "ws", 1) + "/_stcore/stream"
+        self.timeout = timeout
+        self.runs = 0
+        self._ws = None
+        self._widgets = {}  # widget id -> WidgetState sent with every rerun
+        self._elements = {}  # delta path -> Element rendered by the current run
+        self._cache = {}  # message hash -> ForwardMsg, for ref_hash messages
+
+    async def connect(self):
+        self._ws = await asyncio.wait_for(websocket_connect(self.url), self.timeout)
+
+    def close(self):
+        if self._ws is not None:
+            self._ws.close()
+
+    def elements(self, kind):
+        return [getattr(e, kind) for e in self._elements.values() if e.WhichOneof("type") == kind]
+
+    async def run(self, triggers=()):
+        msg = BackMsg()
+        msg.rerun_script.widget_states.widgets.extend([*self._widgets.values(), *triggers])
+        await self._ws.write_message(msg.SerializeToString(), binary=True)
+        await self._wait_for_run()
+
+    async def _wait_for_run(self):
+        while True:
+            raw = await asyncio.wait_for(self._ws.read_message(), self.timeout)
+            if raw is None:
+                raise SessionError("server closed the connection")
+            msg = ForwardMsg()
+            msg.ParseFromString(raw)
+            if msg.WhichOneof("type") == "ref_hash":
+                cached = ForwardMsg()
+                cached.CopyFrom(self._cache[msg.ref_hash])
+                cached.metadata.CopyFrom(msg.metadata)
+                msg = cached
+            elif msg.hash:
+                self._cache[msg.hash] = msg
+
+            kind = msg.WhichOneof("type")
+            if kind == "new_session":
+                # A script run is starting (again, after st.rerun()); start a fresh page
+                self._elements = {}
+            elif kind == "delta" and msg.delta.WhichOneof("type") == "new_element":
+                self._elements[tuple(msg.metadata.delta_path)] = msg.delta.new_element
+            elif kind == "script_finished":
+                self.runs += 1
+                if msg.script_finished == ForwardMsg.FINISHED_EARLY_FOR_RERUN:
+                    continue
+                exceptions = self.elements("exception")
+                if exceptions:
+                    raise SessionError(exceptions[0].message)
+                if msg.script_finished != ForwardMsg.FINISHED_SUCCESSFULLY:
+                    raise SessionError(ForwardMsg.ScriptFinishedStatus.Name(msg.script_finished))
+                return
+
+    def _widget(self, kind, key):
+        for element in self.elements(kind):
+            if element.id.endswith(f"-{key}"):
+                return element
+        raise SessionError(f"{kind} {key!r} not rendered")
+
+    async def goto(self, step):
+        await self.run([WidgetState(id=self._widget("button", f"step_{step}").id, trigger_value=True)])
+
+    async def click(self, label):
+        for button in self.elements("button"):
+            if button.label == label:
+                return await self.run([WidgetState(id=button.id, trigger_value=True)])
+        raise SessionError(f"button {label!r} not rendered")
+
+    def select(self, key, option):
+        selectbox = self._widget("selectbox", key)
+        self._widgets[selectbox.id] = WidgetState(id=selectbox.id, int_value=list(selectbox.options).index(option))
+
+    def set_number(self, key, value):
+        number_input = self._widget("number_input", key)
+        self._widgets[number_input.id] = WidgetState(id=number_input.id, double_value=value)
+
+
+async def _farmer_registration(session):
+    await session.run()
+    await session.click("Register Farmer")
+
+
+async def _sowing_inputs(session):
+    await session.goto(2)
+    await session.click("Record Seed Purchase")
+    await session.click("Record Sowing Activity")
+
+
+async def _growth_monitoring(session):
+    await session.goto(3)
+    await session.click("Record Purchase")
+    await session.click("Record Application")
+
+
+async def _harvest_sale(session):
+    await session.goto(4)
+    await session.click("Record Harvest")
+    await session.click("Record Sale")
+
+
+async def _transport(session):
+    await session.goto(5)
+    await session.click("Complete Transport")
+
+
+async def _retail_distribution(session):
+    await session.goto(6)
+    for retailer, quantity in DEFAULT_ALLOCATIONS:
+        session.select("selected_retailer", retailer)
+        session.set_number("retailer_quantity", quantity)
+        await session.click("Record Distribution")
+
+
+async def _consumer_purchase(session):
+    await session.goto(7)
+    if not any(h.body == "Traceability Report" for h in session.elements("heading")):
+        raise SessionError("traceability report not rendered")
+
+
+WORKFLOW = [
+    (1, _farmer_registration),
+    (2, _sowing_inputs),
+    (3, _growth_monitoring),
+    (4, _harvest_sale),
+    (5, _transport),
+    (6, _retail_distribution),
+    (7, _consumer_purchase),
+]
+
+
+async def run_session(base_url, timeout=30):
+    """Script one session through the full workflow over its own websocket.
+
+    Returns a dict of per-step ``(seconds, runs)`` and the error if any.
+    """
+    result = {"steps": {}, "error": None}
+    session = _Session(base_url, timeout)
+    try:
+        await session.connect()
+        for step, action in WORKFLOW:
+            runs_before = session.runs
+            start = time.perf_counter()
+            try:
+                await action(session)
+            except Exception as e:
+                result["error"] = f"{STEP_NAMES[step]}: {e or type(e).__name__}"
+                break
+            result["steps"][STEP_NAMES[step]] = (time.perf_counter() - start, session.runs - runs_before)
+    except Exception as e:
+        result["error"] = f"connect: {e}"
+    finally:
+        session.close()
+    return result
+
+
+def percentile(sorted_values, pct):
+    # Nearest-rank percentile over an already sorted list
+    if not sorted_values:
+        return float("nan")
+    rank = max(1, math.ceil(pct / 100 * len(sorted_values)))
+    return sorted_values[min(rank, len(sorted_values)) - 1]
+
+
+def summarize(results):
+    summary = {}
+    for name in STEP_NAMES.values():
+        latencies = sorted(r["steps"][name][0] for r in results if name in r["steps"])
+        runs = [r["steps"][name][1] for r in results if name in r["steps"]]
+        if not latencies:
+            continue
+        summary[name] = {
+            "count": len(latencies),
+            "p50_ms": percentile(latencies, 50) * 1000,
+            "p90_ms": percentile(latencies, 90) * 1000,
+            "p95_ms": percentile(latencies, 95) * 1000,
+            "p99_ms": percentile(latencies, 99) * 1000,
+            "max_ms": latencies[-1] * 1000,
+            "runs": sum(runs),
+            "runs_per_session": sum(runs) / len(runs),
+        }
+    return summary
+
+
+def summarize_memory(rss_start, rss_end, sessions):
+    if rss_start is None or rss_end is None:
+        return None
+    return {
+        "rss_start_mb": rss_start / 2**20,
+        "rss_end_mb": rss_end / 2**20,
+        "growth_mb": (rss_end - rss_start) / 2**20,
+        "growth_per_session_kb": (rss_end - rss_start) / 1024 / max(sessions, 1),
+    }
+
+
+async def _drive(base_url, sessions, concurrency, timeout):
+    slots = asyncio.Semaphore(concurrency)
+
+    async def one():
+        async with slots:
+            return await run_session(base_url, timeout)
+
+    return await asyncio.gather(*(one() for _ in range(sessions)))
+
+
+def run_load(sessions, concurrency, timeout=30, url=None, port=0):
+    server = None
+    if url is None:
+        server, url = start_server(port)
+    try:
+        # One uncounted session first, so imports and cache warm-up are not billed as growth
+        warmup = asyncio.run(run_session(url, timeout))
+        if warmup["error"]:
+            raise SessionError(f"warm-up session failed at {warmup['error']}")
+        rss_start = _rss_bytes(server.pid) if server else None
+        start = time.perf_counter()
+        results = asyncio.run(_drive(url, sessions, concurrency, timeout))
+        elapsed = time.perf_counter() - start
+        rss_end = _rss_bytes(server.pid) if server else None
+    finally:
+        if server:
+            server.terminate()
+            server.wait()
+
+    errors = [r["error"] for r in results if r["error"]]
+    return {
+        "url": url,
+        "sessions": sessions,
+        "concurrency": concurrency,
+        "wall_seconds": elapsed,
+        "sessions_per_second": sessions / elapsed if elapsed else 0.0,
+        "completed": sessions - len(errors),
+        "errors": errors,
+        "steps": summarize(results),
+        "memory": summarize_memory(rss_start, rss_end, sessions),
+    }
+
+
+def print_report(report):
+    print(f"{report['completed']}/{report['sessions']} sessions completed against {report['url']} "
+          f"with {report['concurrency']} concurrent sessions in {report['wall_seconds']:.1f}s "
+          f"({report['sessions_per_second']:.2f} sessions/s)")
+    print()
+    header = f"{'step':<22}{'p50 ms':>10}{'p90 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'max ms':>10}{'runs':>8}{'runs/sess':>11}"
+    print(header)
+    print("-" * len(header))
+    for name, s in report["steps"].items():
+        print(f"{name:<22}{s['p50_ms']:>10.1f}{s['p90_ms']:>10.1f}{s['p95_ms']:>10.1f}"
+              f"{s['p99_ms']:>10.1f}{s['max_ms']:>10.1f}{s['runs']:>8}{s['runs_per_session']:>11.1f}")
+    mem = report["memory"]
+    if mem:
+        print()
+        print(f"Server RSS: start {mem['rss_start_mb']:.1f} MB, end {mem['rss_end_mb']:.1f} MB, "
+              f"growth {mem['growth_mb']:+.1f} MB ({mem['growth_per_session_kb']:+.1f} KB per session)")
+    if report["errors"]:
+        print()
+        print(f"{len(report['errors'])} failed sessions, first error: {report['errors'][0]}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sessions", type=int, default=200, help="number of simulated sessions")
+    parser.add_argument("--concurrency", type=int, default=8,
+                        help="sessions in flight at once against the server")
+    parser.add_argument("--timeout", type=float, default=30, help="per-run script timeout in seconds")
+    parser.add_argument("--url", help="drive an already running server (e.g. http://localhost:8501) "
+                                      "instead of starting one; memory is then not reported")
+    parser.add_argument("--port", type=int, default=0, help="port for the started server (default: any free port)")
+    parser.add_argument("--json", metavar="PATH", help="also write the report as JSON")
+    args = parser.parse_args(argv)
+
+    report = run_load(args.sessions, args.concurrency, args.timeout, args.url, args.port)
+    print_report(report)
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(report, f, indent=2)
+    return 1 if report["errors"] else 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
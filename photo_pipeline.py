@@ -0,0 +1,246 @@
+"""Geotagged field photo processing.
+
+Uploaded sowing and fertilizer-application photos are handed to a worker
+pool so the form submission only pays for hashing. Each worker reads the
+EXIF GPS position and capture time, checks the distance to the farmer's
+registered plot, strips EXIF/XMP/comment segments from the original and
+renders a small display thumbnail. JPEGs are decoded at reduced scale
+(``Image.draft``), so a 12 MP photo never has to be fully decompressed.
+Results are kept per (photo, plot) pair, most recently used first, up to
+``max_entries``.
+
+    python photo_pipeline.py --images 24 --workers 4
+"""
+import argparse
+import datetime
+import hashlib
+import math
+import re
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from io import BytesIO
+
+from PIL import ExifTags, Image, ImageOps
+
+THUMBNAIL_SIZE = (320, 320)
+# Processed photos kept in memory; each holds a thumbnail and the geotag check
+MAX_ENTRIES = 64
+# A geotag further than this from the registered plot is flagged
+MAX_PLOT_DISTANCE_KM = 0.5
+HASH_CHUNK = 1 << 20
+
+_COORDINATES = re.compile(r"(-?[\d.]+)\s*°?\s*([NS])?\s*,\s*(-?[\d.]+)\s*°?\s*([EW])?")
+
+
+def hash_stream(fileobj, chunk_size=HASH_CHUNK):
+    # SHA-256 of an upload read in chunks rather than one big read()
+    digest = hashlib.sha256()
+    fileobj.seek(0)
+    for chunk in iter(lambda: fileobj.read(chunk_size), b""):
+        digest.update(chunk)
+    fileobj.seek(0)
+    return digest.hexdigest()
+
+
+def parse_coordinates(text):
+    # "31.0383°N, 78.7377°E" -> (31.0383, 78.7377)
+    match = _COORDINATES.search(text or "")
+    if not match:
+        return None
+    lat, ns, lon, ew = match.groups()
+    lat, lon = float(lat), float(lon)
+    return (-lat if ns == "S" else lat, -lon if ew == "W" else lon)
+
+
+def haversine_km(a, b):
+    lat1, lon1, lat2, lon2 = map(math.radians, (*a, *b))
+    h = math.sin((lat2 - lat1) / 2) ** 2 + math.cos(lat1) * math.cos(lat2) * math.sin((lon2 - lon1) / 2) ** 2
+    return 2 * 6371.0088 * math.asin(math.sqrt(h))
+
+
+def _dms_to_degrees(dms, ref):
+    degrees = float(dms[0]) + float(dms[1]) / 60 + float(dms[2]) / 3600
+    return -degrees if ref in ("S", "W") else degrees
+
+
+def read_exif(image):
+    # GPS position and capture time from EXIF, each None when absent
+    exif = image.getexif()
+    gps = exif.get_ifd(ExifTags.IFD.GPSInfo)
+    position = None
+    try:
+        position = (
+            _dms_to_degrees(gps[ExifTags.GPS.GPSLatitude], gps.get(ExifTags.GPS.GPSLatitudeRef, "N")),
+            _dms_to_degrees(gps[ExifTags.GPS.GPSLongitude], gps.get(ExifTags.GPS.GPSLongitudeRef, "E")),
+        )
+    except (KeyError, IndexError, TypeError, ValueError, ZeroDivisionError):
+        pass
+    taken = exif.get_ifd(ExifTags.IFD.Exif).get(ExifTags.Base.DateTimeOriginal) or exif.get(ExifTags.Base.DateTime)
+    taken_at = None
+    if taken:
+        try:
+            taken_at = datetime.datetime.strptime(str(taken).strip("\x00 "), "%Y:%m:%d %H:%M:%S")
+        except ValueError:
+            pass
+    return position, taken_at
+
+
+def strip_jpeg_metadata(data):
+    """Drop APP1-APP15 (EXIF, XMP, ICC...) and COM segments without re-encoding."""
+    if data[:2] != b"\xff\xd8":
+        return data
+    out = bytearray(data[:2])
+    pos = 2
+    while pos + 4 <= len(data) and data[pos] == 0xFF:
+        marker = data[pos + 1]
+        if marker == 0xDA:  # start of scan: the rest is entropy-coded image data
+            break
+        length = int.from_bytes(data[pos + 2:pos + 4], "big")
+        if not (0xE1 <= marker <= 0xEF or marker == 0xFE):
+            out += data[pos:pos + 2 + length]
+        pos += 2 + length
+    out += data[pos:]
+    return bytes(out)
+
+
+def process_photo(data, plot=None, max_distance_km=MAX_PLOT_DISTANCE_KM, thumbnail_size=THUMBNAIL_SIZE):
+    """Inspect one photo; ``plot`` is the registered ``(lat, lon)`` or None."""
+    image = Image.open(BytesIO(data))
+    width, height = image.size
+    position, taken_at = read_exif(image)
+
+    # Let the JPEG decoder downscale by up to 8x while decoding
+    image.draft("RGB", (thumbnail_size[0] * 2, thumbnail_size[1] * 2))
+    image = ImageOps.exif_transpose(image)
+    image.thumbnail(thumbnail_size)
+    thumb = BytesIO()
+    image.convert("RGB").save(thumb, format="JPEG", quality=80)
+
+    distance = haversine_km(position, plot) if position and plot else None
+    if position is None:
+        check = "No geotag"
+    elif distance is None:
+        check = "Plot coordinates unknown"
+    elif distance <= max_distance_km:
+        check = "Verified"
+    else:
+        check = "Outside plot"
+
+    stripped = strip_jpeg_metadata(data)
+    return {
+        "Width": width,
+        "Height": height,
+        "GPS": position,
+        "TakenAt": taken_at.strftime("%Y-%m-%d %H:%M:%S") if taken_at else None,
+        "DistanceKm": round(distance, 3) if distance is not None else None,
+        "LocationCheck": check,
+        "StrippedBytes": len(stripped),
+        "StrippedHash": hashlib.sha256(stripped).hexdigest(),
+        "Thumbnail": thumb.getvalue(),
+    }
+
+
+def _safe_process(data, plot):
+    try:
+        return process_photo(data, plot)
+    except Exception as e:
+        return {"LocationCheck": "Unreadable image", "Error": str(e), "Thumbnail": None}
+
+
+def _plot_key(plot_coordinates):
+    # "31.0383°N, 78.7377°E" or (lat, lon) -> (lat, lon); None when unknown
+    if isinstance(plot_coordinates, str):
+        return parse_coordinates(plot_coordinates)
+    return tuple(plot_coordinates) if plot_coordinates is not None else None
+
+
+class PhotoPipeline:
+    """Background photo processing keyed by the photo's IPFS hash and the plot it is checked against."""
+
+    def __init__(self, max_workers=4, processes=False, max_entries=MAX_ENTRIES):
+        executor = ProcessPoolExecutor if processes else ThreadPoolExecutor
+        self._pool = executor(max_workers=max_workers)
+        self._futures = OrderedDict()
+        self._lock = threading.Lock()
+        self.max_entries = max_entries
+
+    def submit(self, photo_id, data, plot_coordinates=None):
+        plot = _plot_key(plot_coordinates)
+        key = (photo_id, plot)
+        with self._lock:
+            if key in self._futures:
+                self._futures.move_to_end(key)
+            else:
+                self._futures[key] = self._pool.submit(_safe_process, data, plot)
+                while len(self._futures) > self.max_entries:
+                    self._futures.popitem(last=False)
+            return self._futures[key]
+
+    def result(self, photo_id, plot_coordinates=None):
+        """The finished report, or None while pending; KeyError if never submitted or evicted."""
+        key = (photo_id, _plot_key(plot_coordinates))
+        with self._lock:
+            future = self._futures[key]
+            self._futures.move_to_end(key)
+        if not future.done():
+            return None
+        return future.result()
+
+
+def _synthetic_photo(lat, lon, size=(4000, 3000)):
+    # A 12 MP JPEG with GPS and capture-time EXIF, like a phone camera writes
+    width, height = size
+    gradient = Image.linear_gradient("L").resize(size)
+    noise = Image.effect_noise(size, 40)
+    image = Image.merge("RGB", (gradient, noise, gradient.transpose(Image.Transpose.FLIP_LEFT_RIGHT)))
+
+    def dms(value):
+        value = abs(value)
+        degrees, minutes = int(value), int(value * 60 % 60)
+        return (float(degrees), float(minutes), round(value * 3600 % 60, 2))
+
+    exif = Image.Exif()
+    exif[ExifTags.IFD.GPSInfo] = {
+        ExifTags.GPS.GPSLatitudeRef: "N" if lat >= 0 else "S",
+        ExifTags.GPS.GPSLatitude: dms(lat),
+        ExifTags.GPS.GPSLongitudeRef: "E" if lon >= 0 else "W",
+        ExifTags.GPS.GPSLongitude: dms(lon),
+    }
+    exif[ExifTags.IFD.Exif] = {ExifTags.Base.DateTimeOriginal: "2026:10:19 09:30:00"}
+    buf = BytesIO()
+    image.save(buf, format="JPEG", quality=90, exif=exif)
+    return buf.getvalue()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark photo processing on 12 MP JPEGs")
+    parser.add_argument("--images", type=int, default=24)
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--processes", action="store_true", help="use a process pool instead of threads")
+    args = parser.parse_args(argv)
+
+    plot = (31.0383, 78.7377)
+    photo = _synthetic_photo(31.0391, 78.7369)
+    print(f"test photo: 4000x3000, {len(photo) / 2**20:.1f} MB")
+
+    started = time.perf_counter()
+    report = process_photo(photo, plot)
+    single = time.perf_counter() - started
+    print(f"single photo: {single * 1000:.0f} ms, {report['LocationCheck']} at {report['DistanceKm']} km, "
+          f"stripped {len(photo) - report['StrippedBytes']} bytes of metadata")
+
+    pipeline = PhotoPipeline(args.workers, args.processes, max_entries=args.images)
+    started = time.perf_counter()
+    futures = [pipeline.submit(i, photo, plot) for i in range(args.images)]
+    for future in futures:
+        future.result()
+    elapsed = time.perf_counter() - started
+    kind = "processes" if args.processes else "threads"
+    print(f"{args.images} photos on {args.workers} {kind}: {elapsed:.2f}s, "
+          f"{args.images / elapsed:.1f} photos/s, {args.images * len(photo) / elapsed / 2**20:.0f} MB/s")
+
+
+if __name__ == "__main__":
+    main()
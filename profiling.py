@@ -0,0 +1,243 @@
+"""Lightweight profiling spans and latency metrics for the traceability app.
+
+Everything is off unless ``TRACEABILITY_METRICS=1`` is set, in which case
+``span``/``timed`` record latencies into in-process histograms and counters.
+They are exported as Prometheus text on ``TRACEABILITY_METRICS_PORT``
+(default 9464, ``/metrics``) and, when ``TRACEABILITY_METRICS_JSONL`` names a
+file, as one JSON line per span in a size-rotated log. When disabled, ``span``
+returns a shared no-op context manager and ``timed`` returns the function
+unchanged.
+"""
+import bisect
+import contextlib
+import functools
+import json
+import logging
+import logging.handlers
+import os
+import sys
+import threading
+import time
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+ENABLED = os.environ.get("TRACEABILITY_METRICS", "") not in ("", "0")
+METRICS_PORT = int(os.environ.get("TRACEABILITY_METRICS_PORT", "9464"))
+JSONL_PATH = os.environ.get("TRACEABILITY_METRICS_JSONL", "")
+
+# Histogram bucket upper bounds in seconds
+BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+_NULL_SPAN = contextlib.nullcontext()
+
+
+class Histogram:
+    def __init__(self, buckets=BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+
+class MetricsRegistry:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.histograms = {}
+        self.counters = Counter()
+
+    def observe(self, span_name, seconds):
+        with self._lock:
+            hist = self.histograms.get(span_name)
+            if hist is None:
+                hist = self.histograms[span_name] = Histogram()
+            hist.observe(seconds)
+
+    def inc(self, name, amount=1, **labels):
+        with self._lock:
+            self.counters[(name, tuple(sorted(labels.items())))] += amount
+
+    def render_prometheus(self):
+        lines = [
+            "# HELP traceability_span_seconds Latency of named profiling spans.",
+            "# TYPE traceability_span_seconds histogram",
+        ]
+        with self._lock:
+            for name, hist in sorted(self.histograms.items()):
+                cumulative = 0
+                for bound, count in zip(hist.buckets, hist.counts):
+                    cumulative += count
+                    lines.append(f'traceability_span_seconds_bucket{{span="{name}",le="{bound}"}} {cumulative}')
+                lines.append(f'traceability_span_seconds_bucket{{span="{name}",le="+Inf"}} {hist.count}')
+                lines.append(f'traceability_span_seconds_sum{{span="{name}"}} {hist.sum:.6f}')
+                lines.append(f'traceability_span_seconds_count{{span="{name}"}} {hist.count}')
+            families = sorted({name for name, _ in self.counters})
+            for family in families:
+                lines.append(f"# TYPE traceability_{family} counter")
+                for (name, labels), value in sorted(self.counters.items()):
+                    if name != family:
+                        continue
+                    label_text = ",".join(f'{k}="{v}"' for k, v in labels)
+                    lines.append(f"traceability_{name}{{{label_text}}} {value}")
+        return "\n".join(lines) + "\n"
+
+
+registry = MetricsRegistry()
+
+_span_log = None
+if ENABLED and JSONL_PATH:
+    _span_log = logging.getLogger("traceability.spans")
+    _span_log.propagate = False
+    _handler = logging.handlers.RotatingFileHandler(JSONL_PATH, maxBytes=10 * 2**20, backupCount=5)
+    _handler.setFormatter(logging.Formatter("%(message)s"))
+    _span_log.addHandler(_handler)
+    _span_log.setLevel(logging.INFO)
+
+
+class _Span:
+    __slots__ = ("name", "start")
+
+    def __init__(self, name):
+        self.name = name
+        self.start = time.perf_counter()
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.finish()
+        return False
+
+    def finish(self):
+        elapsed = time.perf_counter() - self.start
+        registry.observe(self.name, elapsed)
+        if _span_log is not None:
+            _span_log.info(json.dumps({"ts": time.time(), "span": self.name, "ms": round(elapsed * 1000, 3)}))
+
+
+def span(name):
+    # Context manager timing a block under ``name``
+    if not ENABLED:
+        return _NULL_SPAN
+    return _Span(name)
+
+
+def begin(name):
+    # For spans that cannot wrap a ``with`` block (e.g. a whole script rerun)
+    return _Span(name) if ENABLED else None
+
+
+def end(token):
+    if token is not None:
+        token.finish()
+
+
+def timed(name):
+    # Decorator version of ``span``; a no-op when metrics are disabled
+    def decorator(fn):
+        if not ENABLED:
+            return fn
+
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            with _Span(name):
+                return fn(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def inc(name, amount=1, **labels):
+    if ENABLED:
+        registry.inc(name, amount, **labels)
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.split("?")[0] != "/metrics":
+            self.send_error(404)
+            return
+        body = registry.render_prometheus().encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+_exporter_lock = threading.Lock()
+_exporter = None
+
+
+def start_exporter():
+    """Serve ``/metrics`` on localhost once per process; safe to call every rerun."""
+    global _exporter
+    if not ENABLED or _exporter is not None:
+        return
+    with _exporter_lock:
+        if _exporter is not None:
+            return
+        try:
+            _exporter = ThreadingHTTPServer(("127.0.0.1", METRICS_PORT), _MetricsHandler)
+        except OSError:
+            # Port taken, e.g. by another app process; keep collecting in-process
+            _exporter = False
+            return
+        threading.Thread(target=_exporter.serve_forever, name="metrics-exporter", daemon=True).start()
+
+
+class SamplingProfiler:
+    """Samples one thread's Python stack at a fixed interval.
+
+    Stacks are kept in collapsed ``outer;inner`` form with their sample
+    counts, which flame graph tools read directly.
+    """
+
+    def __init__(self, thread_id=None, interval=0.005):
+        self.thread_id = thread_id if thread_id is not None else threading.get_ident()
+        self.interval = interval
+        self.samples = Counter()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def _sample(self):
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append(f"{os.path.basename(code.co_filename)}:{code.co_name}:{frame.f_lineno}")
+                frame = frame.f_back
+            if stack:
+                self.samples[";".join(reversed(stack))] += 1
+
+    def start(self):
+        self._thread = threading.Thread(target=self._sample, name="sampling-profiler", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+        return self.samples
+
+
+def collapsed_stacks(samples):
+    return "\n".join(f"{stack} {count}" for stack, count in samples.most_common())
+
+
+def top_frames(samples, n=15):
+    # Leaf frames ranked by how often they were on top of the stack
+    leaves = Counter()
+    for stack, count in samples.items():
+        leaves[stack.rsplit(";", 1)[-1]] += count
+    total = sum(leaves.values()) or 1
+    return [(frame, count, count / total) for frame, count in leaves.most_common(n)]
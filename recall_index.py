@@ -0,0 +1,156 @@
+"""Reverse indexes for recall impact queries.
+
+Each write in the app also records its upstream link here: seed batch to
+sowing, fertilizer batch to application, sowing/application to harvest,
+and harvest to sale, shipment and retail allocation. A recall of any set of
+input batches is then a few set unions and dict lookups, however many
+batches are in the system.
+
+    python recall_index.py --farms 5000 --recall 1000
+"""
+import argparse
+import csv
+import io
+import random
+import threading
+import time
+from collections import defaultdict
+
+SEED = "seed"
+FERTILIZER = "fertilizer"
+
+
+class RecallIndex:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._sowings_by_seed = defaultdict(set)
+        self._applications_by_fertilizer = defaultdict(set)
+        self._harvests_by_input = defaultdict(set)
+        self.harvests = {}
+        self._sales = defaultdict(dict)
+        self._shipments = defaultdict(dict)
+        self._allocations = defaultdict(lambda: defaultdict(int))
+
+    def record_sowing(self, sowing_id, seed_batch):
+        with self._lock:
+            self._sowings_by_seed[seed_batch].add(sowing_id)
+
+    def record_application(self, application_id, fertilizer_batch):
+        with self._lock:
+            self._applications_by_fertilizer[fertilizer_batch].add(application_id)
+
+    def record_harvest(self, harvest_id, input_ids, **details):
+        """Link a harvest to the sowing and application records it came from."""
+        with self._lock:
+            self.harvests[harvest_id] = {"HarvestID": harvest_id, **details}
+            for input_id in input_ids:
+                self._harvests_by_input[input_id].add(harvest_id)
+
+    def record_sale(self, harvest_id, sale_tx, buyer):
+        with self._lock:
+            self._sales[harvest_id][sale_tx] = buyer
+
+    def record_shipment(self, harvest_id, shipment_id, destination):
+        with self._lock:
+            self._shipments[harvest_id][shipment_id] = destination
+
+    def record_allocation(self, harvest_id, retailer, location, quantity_kg):
+        with self._lock:
+            self._allocations[harvest_id][(retailer, location)] += quantity_kg
+
+    def affected_harvests(self, seed_batches=(), fertilizer_batches=()):
+        with self._lock:
+            inputs = set()
+            for batch in seed_batches:
+                inputs |= self._sowings_by_seed.get(batch, set())
+            for batch in fertilizer_batches:
+                inputs |= self._applications_by_fertilizer.get(batch, set())
+            harvests = set()
+            for input_id in inputs:
+                harvests |= self._harvests_by_input.get(input_id, set())
+            return harvests
+
+    def recall(self, seed_batches=(), fertilizer_batches=()):
+        """Everything downstream of the given input batches.
+
+        Returns per-harvest rows (with sales, shipments and retail
+        allocations) and the affected retailers with total quantities.
+        """
+        harvests = self.affected_harvests(seed_batches, fertilizer_batches)
+        rows = []
+        retailers = defaultdict(int)
+        with self._lock:
+            for harvest_id in sorted(harvests):
+                allocations = dict(self._allocations.get(harvest_id, {}))
+                for key, quantity in allocations.items():
+                    retailers[key] += quantity
+                rows.append({
+                    **self.harvests.get(harvest_id, {"HarvestID": harvest_id}),
+                    "Sales": dict(self._sales.get(harvest_id, {})),
+                    "Shipments": dict(self._shipments.get(harvest_id, {})),
+                    "Allocations": allocations,
+                })
+        return {
+            "harvests": rows,
+            "retailers": [
+                {"Retailer": name, "Location": location, "QuantityKg": quantity}
+                for (name, location), quantity in sorted(retailers.items(), key=lambda kv: -kv[1])
+            ],
+        }
+
+
+def parse_batches(text):
+    # Batch numbers separated by commas, spaces or new lines
+    return [b for b in text.replace(",", " ").split() if b]
+
+
+def export_csv(result):
+    # One row per harvest and retailer allocation; harvests not yet in retail get one blank row
+    buf = io.StringIO()
+    writer = csv.writer(buf)
+    writer.writerow(["HarvestID", "FarmerID", "Crop", "HarvestQuantityKg", "Buyers", "Shipments",
+                     "Retailer", "Location", "AllocatedKg"])
+    for row in result["harvests"]:
+        base = [row["HarvestID"], row.get("FarmerID", ""), row.get("Crop", ""), row.get("QuantityKg", ""),
+                "; ".join(row["Sales"].values()), "; ".join(f"{s} to {d}" for s, d in row["Shipments"].items())]
+        if not row["Allocations"]:
+            writer.writerow(base + ["", "", ""])
+        for (retailer, location), quantity in row["Allocations"].items():
+            writer.writerow(base + [retailer, location, quantity])
+    return buf.getvalue()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark recall queries over a synthetic supply chain")
+    parser.add_argument("--farms", type=int, default=5000)
+    parser.add_argument("--seed-batches", type=int, default=2000)
+    parser.add_argument("--recall", type=int, default=1000, help="seed batches recalled at once")
+    args = parser.parse_args(argv)
+
+    rng = random.Random(3)
+    index = RecallIndex()
+    retailers = [("FreshMart", "Mumbai"), ("Organic Bazaar", "Pune"), ("Farm2Table", "Delhi")]
+    started = time.perf_counter()
+    for n in range(args.farms):
+        seed_batch = f"SEED{rng.randrange(args.seed_batches)}"
+        fert_batch = f"FERT{rng.randrange(args.seed_batches)}"
+        index.record_sowing(f"S{n}", seed_batch)
+        index.record_application(f"A{n}", fert_batch)
+        index.record_harvest(f"H{n}", [f"S{n}", f"A{n}"], FarmerID=f"FARM{n}", Crop="Sharbati Wheat", QuantityKg=500)
+        index.record_sale(f"H{n}", f"SALE{n}", "AgriMarkt Pvt Ltd")
+        index.record_shipment(f"H{n}", f"SHIP{n}", "Mumbai")
+        for retailer, location in rng.sample(retailers, 2):
+            index.record_allocation(f"H{n}", retailer, location, 250)
+    print(f"indexed {args.farms} farm batches in {time.perf_counter() - started:.2f}s")
+
+    recalled = [f"SEED{n}" for n in range(args.recall)]
+    started = time.perf_counter()
+    result = index.recall(seed_batches=recalled)
+    elapsed = time.perf_counter() - started
+    total = sum(r["QuantityKg"] for r in result["retailers"])
+    print(f"recall of {len(recalled)} seed batches: {elapsed * 1000:.1f} ms, {len(result['harvests'])} harvests, "
+          f"{len(result['retailers'])} retailers, {total} kg")
+
+
+if __name__ == "__main__":
+    main()
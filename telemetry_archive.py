@@ -0,0 +1,460 @@
+"""Compressed, append-only archive of closed shipments' sensor series.
+
+Each shipment is cut into blocks of up to ``BLOCK_READINGS`` readings. A
+block header carries the shipment id, reading count, first/last timestamp
+and min/max temperature and humidity; the payload is one bitstream with
+delta-of-delta timestamps and Gorilla XOR-compressed values. Values are
+stored at sensor resolution (0.01 °C / %RH, 1e-4 degree positions) as
+integer-valued doubles, which keeps the XOR of neighbouring readings down
+to a few meaningful bits.
+
+Opening an archive walks the block headers only. Range queries pick blocks
+from that index and decode just those, straight from an mmap of the file.
+Appends hold an exclusive lock on the file, index whatever other processes
+appended since, and skip shipments that are already archived, so several app
+processes can share one archive without writing a shipment twice. Without
+``fcntl`` (Windows) there is no file lock, so only one process should write.
+
+Reading never modifies the file: indexing stops at the first block that is
+incomplete or unreadable. Only an append, holding the lock, cuts off a torn
+tail left by an interrupted write.
+
+    python telemetry_archive.py --shipments 500 --readings 288
+"""
+import argparse
+import contextlib
+import logging
+import mmap
+import os
+import pickle
+import struct
+import threading
+import time
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+from transport_simulator import SAFE_MAX_TEMP, format_locations, simulate_fleet
+
+try:
+    import fcntl
+except ImportError:  # Windows: appends are then only serialized within one process
+    fcntl = None
+
+log = logging.getLogger(__name__)
+
+ARCHIVE_PATH = Path(os.environ.get("TRACEABILITY_TELEMETRY_ARCHIVE",
+                                   Path(__file__).with_name("data") / "telemetry" / "shipments.tlm"))
+BLOCK_READINGS = 256
+
+MAGIC = b"TLB1"
+# magic, id length, readings, first/last timestamp, temp min/max, humidity min/max, payload bytes
+HEADER = struct.Struct("<4sHIqqddddI")
+# Stored value = round(reading * scale); positions at the precision the app displays
+SCALES = {"temperature": 100.0, "humidity": 100.0, "lat": 1e4, "lon": 1e4}
+
+_LOCATION = r"(-?[\d.]+)°N,\s*(-?[\d.]+)°E"
+
+
+class _BitWriter:
+    def __init__(self):
+        self._out = bytearray()
+        self._acc = 0
+        self._bits = 0
+
+    def write(self, value, nbits):
+        self._acc = (self._acc << nbits) | value
+        self._bits += nbits
+        if self._bits >= 64:
+            spill = self._bits & 7
+            self._out += (self._acc >> spill).to_bytes((self._bits - spill) // 8, "big")
+            self._acc &= (1 << spill) - 1
+            self._bits = spill
+
+    def getvalue(self):
+        pad = -self._bits % 8
+        return bytes(self._out) + (self._acc << pad).to_bytes((self._bits + pad) // 8, "big")
+
+
+class _BitReader:
+    def __init__(self, data):
+        # 8 bytes of padding so a read never has to check the end
+        self._data = bytes(data) + bytes(8)
+        self._pos = 0
+
+    def read(self, nbits):
+        if nbits == 0:
+            return 0
+        byte, offset = divmod(self._pos, 8)
+        span = (offset + nbits + 7) // 8
+        window = int.from_bytes(self._data[byte:byte + span], "big")
+        self._pos += nbits
+        return (window >> (span * 8 - offset - nbits)) & ((1 << nbits) - 1)
+
+
+def _signed(value, nbits):
+    return value - (1 << nbits) if value >> (nbits - 1) else value
+
+
+# Delta-of-delta buckets: (prefix, prefix bits, value bits)
+_DOD_BUCKETS = ((0b10, 2, 7), (0b110, 3, 9), (0b1110, 4, 12))
+
+
+def _encode_timestamps(writer, seconds):
+    writer.write(int(seconds[0]) & (2**64 - 1), 64)
+    for dod in np.diff(np.diff(seconds, prepend=seconds[0])).tolist():
+        if dod == 0:
+            writer.write(0, 1)
+            continue
+        for prefix, prefix_bits, value_bits in _DOD_BUCKETS:
+            if -(1 << (value_bits - 1)) <= dod < 1 << (value_bits - 1):
+                writer.write(prefix, prefix_bits)
+                writer.write(dod & ((1 << value_bits) - 1), value_bits)
+                break
+        else:
+            writer.write(0b1111, 4)
+            writer.write(dod & (2**64 - 1), 64)
+
+
+def _decode_timestamps(reader, count):
+    first = _signed(reader.read(64), 64)
+    out = [first]
+    delta = 0
+    for _ in range(count - 1):
+        if reader.read(1):
+            for _, prefix_bits, value_bits in _DOD_BUCKETS:
+                if not reader.read(1):
+                    delta += _signed(reader.read(value_bits), value_bits)
+                    break
+            else:
+                delta += _signed(reader.read(64), 64)
+        out.append(out[-1] + delta)
+    return out
+
+
+def _encode_values(writer, values):
+    bits = np.ascontiguousarray(values, dtype="<f8").view("<u8").tolist()
+    writer.write(bits[0], 64)
+    leading, trailing = 65, 0
+    for previous, current in zip(bits, bits[1:]):
+        xor = previous ^ current
+        if xor == 0:
+            writer.write(0, 1)
+            continue
+        lz = min(64 - xor.bit_length(), 31)
+        tz = (xor & -xor).bit_length() - 1
+        if lz >= leading and tz >= trailing:
+            # Fits the previous meaningful-bit window
+            writer.write(0b10, 2)
+            writer.write(xor >> trailing, 64 - leading - trailing)
+        else:
+            leading, trailing = lz, tz
+            meaningful = 64 - lz - tz
+            writer.write(0b11, 2)
+            writer.write(lz, 5)
+            writer.write(meaningful & 63, 6)
+            writer.write(xor >> tz, meaningful)
+
+
+def _decode_values(reader, count):
+    current = reader.read(64)
+    out = [current]
+    leading = trailing = 0
+    for _ in range(count - 1):
+        if reader.read(1):
+            if reader.read(1):
+                leading = reader.read(5)
+                meaningful = reader.read(6) or 64
+                trailing = 64 - leading - meaningful
+            current ^= reader.read(64 - leading - trailing) << trailing
+        out.append(current)
+    return np.array(out, dtype="<u8").view("<f8")
+
+
+def _nan_bounds(values):
+    finite = values[~np.isnan(values)]
+    return (float(finite.min()), float(finite.max())) if finite.size else (float("nan"), float("nan"))
+
+
+def encode_block(shipment_id, seconds, columns):
+    """Header plus payload bytes for one block; ``columns`` maps SCALES names to arrays."""
+    writer = _BitWriter()
+    _encode_timestamps(writer, seconds)
+    for name, scale in SCALES.items():
+        _encode_values(writer, np.round(np.asarray(columns[name], dtype=float) * scale))
+    payload = writer.getvalue()
+    name = shipment_id.encode()
+    header = HEADER.pack(MAGIC, len(name), len(seconds), int(seconds[0]), int(seconds[-1]),
+                         *_nan_bounds(np.asarray(columns["temperature"], dtype=float)),
+                         *_nan_bounds(np.asarray(columns["humidity"], dtype=float)), len(payload))
+    return header + name + payload
+
+
+def decode_block(payload, count):
+    reader = _BitReader(payload)
+    seconds = _decode_timestamps(reader, count)
+    columns = {name: _decode_values(reader, count) / scale for name, scale in SCALES.items()}
+    return np.array(seconds, dtype="datetime64[s]"), columns
+
+
+@contextlib.contextmanager
+def _locked(f):
+    # Exclusive advisory lock on an open archive file, across processes
+    if fcntl is not None:
+        fcntl.flock(f.fileno(), fcntl.LOCK_EX)
+    try:
+        yield f
+    finally:
+        if fcntl is not None:
+            fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+
+
+class TelemetryArchive:
+    """Append-only block file with an in-memory index of block headers."""
+
+    def __init__(self, path=ARCHIVE_PATH, block_readings=BLOCK_READINGS):
+        self.path = Path(path)
+        self.block_readings = block_readings
+        # (offset of payload, payload bytes, readings, first, last, temp min, temp max, hum min, hum max)
+        self._blocks = {}
+        # Bytes of the file indexed so far
+        self._end = 0
+        # Offset of an unreadable block already logged
+        self._bad_at = None
+        self._lock = threading.Lock()
+        self.refresh()
+
+    def refresh(self):
+        """Index blocks appended since the last look, including by other processes."""
+        with self._lock:
+            if not self.path.exists() or self.path.stat().st_size == self._end:
+                return
+            with open(self.path, "rb") as f, _locked(f):
+                self._scan(f)
+
+    def _scan(self, f):
+        # Index complete blocks from the indexed end; stops at the first incomplete
+        # or unreadable one and returns True if the rest of the file is a torn tail
+        size = os.fstat(f.fileno()).st_size
+        if size <= self._end:
+            return False
+        pos = self._end
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            while pos + HEADER.size <= size:
+                magic, id_len, count, first, last, tmin, tmax, hmin, hmax, length = HEADER.unpack_from(mm, pos)
+                start = pos + HEADER.size + id_len
+                if magic != MAGIC:
+                    break
+                if start + length > size:
+                    if mm.find(MAGIC, pos + HEADER.size) != -1:
+                        # Another block follows, so the length is damaged
+                        break
+                    # The last block is incomplete: a write in progress or cut short
+                    self._end = pos
+                    return True
+                try:
+                    shipment_id = bytes(mm[pos + HEADER.size:start]).decode()
+                except UnicodeDecodeError:
+                    break
+                self._blocks.setdefault(shipment_id, []).append(
+                    (start, length, count, first, last, tmin, tmax, hmin, hmax))
+                pos = start + length
+            else:
+                # Fewer bytes than a header left: torn only if they begin like one
+                tail = mm[pos:size]
+                self._end = pos
+                return 0 < len(tail) and tail[:len(MAGIC)] == MAGIC[:len(tail)]
+        self._end = pos
+        if self._bad_at != pos:
+            self._bad_at = pos
+            log.warning("%s: unreadable block at offset %d of %d; later blocks are not indexed",
+                        self.path, pos, size)
+        return False
+
+    def __len__(self):
+        return len(self._blocks)
+
+    def __contains__(self, shipment_id):
+        return shipment_id in self._blocks
+
+    def shipments(self):
+        self.refresh()
+        return list(self._blocks)
+
+    def span(self, shipment_id):
+        # (first, last) timestamp of a shipment, from the index alone
+        blocks = self._blocks.get(shipment_id)
+        if not blocks:
+            return None
+        return (pd.Timestamp(blocks[0][3], unit="s"), pd.Timestamp(blocks[-1][4], unit="s"))
+
+    def append(self, shipment_id, frame):
+        """Archive one shipment's readings; returns False if it was already archived.
+
+        ``frame`` has ``Timestamp``, ``Temperature (°C)`` and ``Humidity (%)``
+        and either ``Latitude``/``Longitude`` or the app's ``Location`` strings.
+        """
+        if frame.empty or shipment_id in self._blocks:
+            return False
+        frame = frame.sort_values("Timestamp", kind="stable")
+        seconds = frame["Timestamp"].to_numpy().astype("datetime64[s]").astype(np.int64)
+        if "Latitude" in frame:
+            lat, lon = frame["Latitude"].to_numpy(), frame["Longitude"].to_numpy()
+        else:
+            position = frame["Location"].str.extract(_LOCATION).astype(float)
+            lat, lon = position[0].to_numpy(), position[1].to_numpy()
+        columns = {
+            "temperature": frame["Temperature (°C)"].to_numpy(),
+            "humidity": frame["Humidity (%)"].to_numpy(),
+            "lat": lat,
+            "lon": lon,
+        }
+        blocks = []
+        for first in range(0, len(seconds), self.block_readings):
+            part = slice(first, first + self.block_readings)
+            blocks.append(encode_block(shipment_id, seconds[part], {k: v[part] for k, v in columns.items()}))
+        return self._write(shipment_id, blocks)
+
+    def _write(self, shipment_id, blocks):
+        with self._lock:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            with open(self.path, "a+b") as f, _locked(f):
+                # Check and append under one lock, against an index that includes other processes' appends
+                torn = self._scan(f)
+                if shipment_id in self._blocks:
+                    return False
+                size = f.seek(0, os.SEEK_END)
+                if torn and size > self._end:
+                    # No writer is mid-append while we hold the lock: the tail is what an
+                    # interrupted write left, dropped so appends stay aligned
+                    log.warning("%s: dropping %d bytes of an incomplete block at offset %d",
+                                self.path, size - self._end, self._end)
+                    f.truncate(self._end)
+                    size = self._end
+                pos = size
+                f.write(b"".join(blocks))
+                f.flush()
+                os.fsync(f.fileno())
+            for block in blocks:
+                magic, id_len, count, first, last, tmin, tmax, hmin, hmax, length = HEADER.unpack_from(block)
+                start = pos + HEADER.size + id_len
+                self._blocks.setdefault(shipment_id, []).append(
+                    (start, length, count, first, last, tmin, tmax, hmin, hmax))
+                pos = start + length
+            if self._end == size:
+                # Past an unreadable block the index stays put; this shipment is indexed above
+                self._end = pos
+            return True
+
+    def read(self, shipment_id, start=None, end=None, locations=True):
+        """Readings of one shipment with ``start <= Timestamp <= end``.
+
+        Only blocks whose time range overlaps the query are decoded.
+        """
+        lo = -2**63 if start is None else pd.Timestamp(start).value // 10**9
+        hi = 2**63 - 1 if end is None else pd.Timestamp(end).value // 10**9
+        blocks = [b for b in self._blocks.get(shipment_id, ()) if b[4] >= lo and b[3] <= hi]
+        parts = []
+        if blocks:
+            with open(self.path, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                for offset, length, count, *_ in blocks:
+                    parts.append(decode_block(mm[offset:offset + length], count))
+        if not parts:
+            timestamps, columns = np.array([], dtype="datetime64[s]"), {name: np.array([]) for name in SCALES}
+        else:
+            timestamps = np.concatenate([p[0] for p in parts])
+            columns = {name: np.concatenate([p[1][name] for p in parts]) for name in SCALES}
+        seconds = timestamps.astype(np.int64)
+        keep = (seconds >= lo) & (seconds <= hi)
+        frame = pd.DataFrame({
+            "Timestamp": timestamps[keep],
+            "Temperature (°C)": columns["temperature"][keep],
+            "Humidity (%)": columns["humidity"][keep],
+        })
+        if locations:
+            frame["Location"] = format_locations(columns["lat"][keep], columns["lon"][keep])
+        else:
+            frame["Latitude"] = columns["lat"][keep]
+            frame["Longitude"] = columns["lon"][keep]
+        return frame
+
+    def excursions(self, threshold=SAFE_MAX_TEMP):
+        # Shipments with any reading above ``threshold``, found from block maxima without decoding
+        return [shipment_id for shipment_id, blocks in list(self._blocks.items())
+                if any(b[6] > threshold for b in blocks)]
+
+    def size_bytes(self):
+        return self.path.stat().st_size if self.path.exists() else 0
+
+
+def _fleet_frames(n_shipments, n_readings, seed):
+    # One single-sensor frame per shipment, five-minute readings with skew and dropouts
+    frames = {}
+    for chunk in simulate_fleet(n_shipments, 1, n_readings, start=pd.Timestamp("2026-10-19"), seed=seed,
+                                freq_seconds=86400 // n_readings, chunk_shipments=250):
+        for i, shipment in enumerate(chunk["shipment"].tolist()):
+            frames[f"SHIP{shipment:06d}"] = pd.DataFrame({
+                "Timestamp": chunk["timestamp"][i, 0],
+                "Temperature (°C)": chunk["temperature"][i, 0].round(2),
+                "Humidity (%)": chunk["humidity"][i, 0].round(2),
+                "Location": format_locations(chunk["lat"][i], chunk["lon"][i]),
+            })
+    return frames
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Compare the telemetry archive with CSV and pickle")
+    parser.add_argument("--shipments", type=int, default=500)
+    parser.add_argument("--readings", type=int, default=288, help="readings per shipment (288 = 5-minute day)")
+    parser.add_argument("--path", default="bench_telemetry.tlm")
+    parser.add_argument("--seed", type=int, default=5)
+    args = parser.parse_args(argv)
+
+    frames = _fleet_frames(args.shipments, args.readings, args.seed)
+    everything = pd.concat(frames, names=["Shipment", None]).reset_index(level=0)
+    readings = len(everything)
+    csv_bytes = len(everything.to_csv(index=False).encode())
+    pickle_bytes = len(pickle.dumps(everything, protocol=pickle.HIGHEST_PROTOCOL))
+
+    path = Path(args.path)
+    path.unlink(missing_ok=True)
+    archive = TelemetryArchive(path)
+    started = time.perf_counter()
+    for shipment_id, frame in frames.items():
+        archive.append(shipment_id, frame)
+    write_time = time.perf_counter() - started
+    archive_bytes = archive.size_bytes()
+
+    print(f"{readings:,} readings from {args.shipments} shipments")
+    for label, size in (("CSV", csv_bytes), ("pickle", pickle_bytes), ("archive", archive_bytes)):
+        print(f"  {label:<8} {size / 2**20:8.2f} MB  {size / readings:6.1f} bytes/reading  "
+              f"{csv_bytes / size:5.1f}x smaller than CSV")
+    print(f"archive write: {readings / write_time:,.0f} readings/s")
+
+    started = time.perf_counter()
+    archive = TelemetryArchive(path)
+    print(f"reopen (index {len(archive)} shipments from headers): {(time.perf_counter() - started) * 1000:.1f} ms")
+
+    shipment_id = next(iter(frames))
+    first, last = archive.span(shipment_id)
+    window = (first + (last - first) / 2, first + (last - first) / 2 + pd.Timedelta(hours=2))
+    queries = 200
+    started = time.perf_counter()
+    for _ in range(queries):
+        result = archive.read(shipment_id, *window)
+    print(f"2-hour range query: {(time.perf_counter() - started) / queries * 1000:.2f} ms, {len(result)} readings")
+
+    original = frames[shipment_id]
+    restored = archive.read(shipment_id)
+    pd.testing.assert_frame_equal(
+        original.reset_index(drop=True).astype({"Timestamp": "datetime64[s]"}),
+        restored.astype({"Timestamp": "datetime64[s]"}),
+        check_exact=False, atol=1e-9,
+    )
+    print(f"round trip exact at sensor resolution; {len(archive.excursions())} shipments above {SAFE_MAX_TEMP}°C")
+    path.unlink()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,224 @@
+"""Vectorized cold-chain transport simulator.
+
+Generates N shipments x M sensors x T readings per chunk in a handful of
+numpy operations: route trajectories between hubs, diurnal temperature
+drift, door-open spikes, sensor dropouts and per-sensor clock skew. Chunks
+are streamed to a sink so a whole fleet day never has to sit in memory.
+Every shipment draws from its own generator, spawned from the fleet seed by
+shipment number, so a seed reproduces the same fleet whatever the chunking.
+
+    python transport_simulator.py --shipments 1000 --sensors 4 --readings 288
+"""
+import argparse
+import time
+
+import numpy as np
+import pandas as pd
+
+# (name, latitude, longitude)
+ORIGIN_HUBS = [
+    ("Pune", 18.5204, 73.8567),
+    ("Nashik", 19.9975, 73.7898),
+    ("Uttarkashi", 31.0383, 78.7377),
+    ("Dehradun", 30.3165, 78.0322),
+    ("Indore", 22.7196, 75.8577),
+]
+DESTINATION_HUBS = [
+    ("Mumbai", 19.0760, 72.8777),
+    ("Delhi", 28.7041, 77.1025),
+    ("Ahmedabad", 23.0225, 72.5714),
+    ("Bengaluru", 12.9716, 77.5946),
+]
+
+SAFE_MAX_TEMP = 5.0
+
+# How many readings a door-open spike takes to decay
+SPIKE_KERNEL = 8
+# Longest sensor dropout, in readings
+MAX_DROPOUT = 6
+
+
+def _decay_shift(impulses, decay, length):
+    # out[..., t] = sum_k impulses[..., t-k] * decay**k, as `length` shifted adds
+    out = impulses.copy()
+    for k in range(1, length):
+        out[..., k:] += impulses[..., :-k] * decay ** k
+    return out
+
+
+def _draw(rngs, method, *args, size=()):
+    # One draw of ``size`` per shipment, each from that shipment's own generator
+    return np.stack([getattr(rng, method)(*args, size=size) for rng in rngs])
+
+
+def simulate_chunk(rngs, n_shipments, n_sensors, n_readings, start, freq_seconds=3600,
+                   door_opens_per_hour=0.015, dropout_rate=0.002, max_skew_seconds=120,
+                   origins=None, destinations=None, first_shipment=0):
+    """Simulate one chunk of shipments in a single vectorized pass.
+
+    Returns a dict of arrays shaped ``(shipments, sensors, readings)`` for the
+    sensor series, ``(shipments, readings)`` for the shared truck position and
+    ``(shipments,)`` for per-shipment attributes. ``rngs`` holds one
+    generator per shipment.
+    """
+    S, M, T = n_shipments, n_sensors, n_readings
+    origins = ORIGIN_HUBS if origins is None else origins
+    destinations = DESTINATION_HUBS if destinations is None else destinations
+
+    # Routes: uneven progress along the origin-destination leg with a lateral bow
+    origin_idx = _draw(rngs, "integers", len(origins))
+    dest_idx = _draw(rngs, "integers", len(destinations))
+    o = np.array([h[1:] for h in origins])[origin_idx]
+    d = np.array([h[1:] for h in destinations])[dest_idx]
+    speed = _draw(rngs, "gamma", 4.0, 1.0, size=T)
+    speed[:, 0] = 0.0
+    progress = np.cumsum(speed, axis=1)
+    progress /= np.maximum(progress[:, -1:], 1e-9)
+    leg = d - o
+    normal = np.stack([-leg[:, 1], leg[:, 0]], axis=1) * _draw(rngs, "normal", 0, 0.08, size=1)
+    bow = np.sin(np.pi * progress)
+    lat = o[:, :1] + leg[:, :1] * progress + normal[:, :1] * bow
+    lon = o[:, 1:] + leg[:, 1:] * progress + normal[:, 1:] * bow
+
+    # Temperature: per-truck setpoint, diurnal drift peaking mid-afternoon,
+    # per-sensor bias and reading noise
+    elapsed = np.arange(T) * freq_seconds
+    start_hour = start.hour + start.minute / 60
+    hour = (start_hour + elapsed / 3600) % 24
+    diurnal = np.sin(2 * np.pi * (hour - 9) / 24)
+    setpoint = _draw(rngs, "normal", 3.5, 0.3, size=(1, 1))
+    amplitude = _draw(rngs, "uniform", 0.2, 0.6, size=(1, 1))
+    bias = _draw(rngs, "normal", 0.0, 0.2, size=(M, 1))
+    temperature = setpoint + amplitude * diurnal + bias + _draw(rngs, "normal", 0.0, 0.3, size=(M, T))
+    humidity = 65 - 4 * diurnal + _draw(rngs, "normal", 0.0, 3.0, size=(M, T))
+
+    # Door-open events hit every sensor on the truck, then decay
+    doors = _draw(rngs, "random", size=(1, T)) < door_opens_per_hour * freq_seconds / 3600
+    spikes = _decay_shift(doors * _draw(rngs, "uniform", 2.0, 5.0, size=(1, T)), 0.55, SPIKE_KERNEL)
+    temperature += spikes
+    humidity += spikes * 2.5
+    np.clip(humidity, 0, 100, out=humidity)
+
+    # Dropouts: bursts of missing readings per sensor
+    if dropout_rate > 0:
+        starts = _draw(rngs, "random", size=(M, T)) < dropout_rate
+        lengths = _draw(rngs, "integers", 1, MAX_DROPOUT + 1, size=(M, T))
+        missing = starts.copy()
+        for k in range(1, MAX_DROPOUT):
+            missing[..., k:] |= starts[..., :-k] & (lengths[..., :-k] > k)
+        temperature[missing] = np.nan
+        humidity[missing] = np.nan
+
+    # Clock skew: constant offset plus drift in parts per million, per sensor
+    offset = _draw(rngs, "uniform", -max_skew_seconds, max_skew_seconds, size=(M, 1)) if max_skew_seconds else 0
+    drift_ppm = _draw(rngs, "normal", 0, 20, size=(M, 1)) if max_skew_seconds else 0
+    skewed = elapsed + offset + elapsed * drift_ppm * 1e-6
+    timestamps = np.datetime64(start.to_datetime64(), "s") + np.rint(
+        np.broadcast_to(skewed, (S, M, T))).astype("timedelta64[s]")
+
+    return {
+        "shipment": np.arange(first_shipment, first_shipment + S),
+        "origin": np.array([h[0] for h in origins])[origin_idx],
+        "destination": np.array([h[0] for h in destinations])[dest_idx],
+        "timestamp": timestamps,
+        "temperature": temperature,
+        "humidity": humidity,
+        "door_open": np.broadcast_to(doors, (S, M, T)),
+        "lat": lat,
+        "lon": lon,
+    }
+
+
+def simulate_fleet(n_shipments, n_sensors=1, n_readings=24, start=None, seed=None,
+                   chunk_shipments=1000, **kwargs):
+    # Yield the fleet chunk by chunk; the same seed reproduces the same fleet for any chunk size
+    seeds = np.random.SeedSequence(seed)
+    start = pd.Timestamp.now().floor("h") if start is None else pd.Timestamp(start)
+    for first in range(0, n_shipments, chunk_shipments):
+        size = min(chunk_shipments, n_shipments - first)
+        # spawn() hands out children in order, so shipment k always gets child k
+        rngs = [np.random.default_rng(child) for child in seeds.spawn(size)]
+        yield simulate_chunk(rngs, size, n_sensors, n_readings, start, first_shipment=first, **kwargs)
+
+
+def stream_fleet(sink, n_shipments, **kwargs):
+    # Push each chunk to ``sink`` (e.g. the alerting pipeline); returns readings sent
+    total = 0
+    for chunk in simulate_fleet(n_shipments, **kwargs):
+        sink(chunk)
+        total += chunk["temperature"].size
+    return total
+
+
+def cold_chain_alerts(chunk, threshold=SAFE_MAX_TEMP):
+    # Per-shipment peak temperature and number of readings above threshold
+    temps = chunk["temperature"].reshape(len(chunk["shipment"]), -1)
+    with np.errstate(invalid="ignore"):
+        excursions = (temps > threshold).sum(axis=1)
+    return pd.DataFrame({
+        "shipment": chunk["shipment"],
+        "max_temp": np.where(np.isnan(temps), -np.inf, temps).max(axis=1),
+        "excursions": excursions,
+        "missing": np.isnan(temps).sum(axis=1),
+    }).query("excursions > 0")
+
+
+def format_locations(lat, lon):
+    # Vectorized "18.5000°N, 73.8000°E" strings
+    return np.char.add(np.char.add(np.char.mod("%.4f°N, ", lat), np.char.mod("%.4f", lon)), "°E")
+
+
+def to_frame(chunk, locations=False):
+    # Long-format readings, one row per shipment x sensor x reading
+    S, M, T = chunk["temperature"].shape
+    frame = pd.DataFrame({
+        "Shipment": np.repeat(chunk["shipment"], M * T),
+        "Sensor": np.tile(np.repeat(np.arange(M), T), S),
+        "Timestamp": chunk["timestamp"].ravel(),
+        "Temperature (°C)": chunk["temperature"].ravel(),
+        "Humidity (%)": chunk["humidity"].ravel(),
+        "DoorOpen": chunk["door_open"].ravel(),
+        "Latitude": np.repeat(chunk["lat"], M, axis=0).ravel(),
+        "Longitude": np.repeat(chunk["lon"], M, axis=0).ravel(),
+    })
+    if locations:
+        frame["Location"] = format_locations(frame["Latitude"].to_numpy(), frame["Longitude"].to_numpy())
+    return frame
+
+
+def simulate_shipment(start, n_readings=24, origin=ORIGIN_HUBS[0], destination=DESTINATION_HUBS[0],
+                      seed=None, **kwargs):
+    """Single-sensor series in the shape step 5 of the app displays."""
+    kwargs.setdefault("dropout_rate", 0.0)
+    kwargs.setdefault("max_skew_seconds", 0)
+    chunk = next(simulate_fleet(1, 1, n_readings, start=start, seed=seed,
+                                origins=[origin], destinations=[destination], **kwargs))
+    frame = to_frame(chunk, locations=True)
+    return frame[["Timestamp", "Temperature (°C)", "Humidity (%)", "Location"]]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the vectorized fleet simulator")
+    parser.add_argument("--shipments", type=int, default=1000)
+    parser.add_argument("--sensors", type=int, default=4)
+    parser.add_argument("--readings", type=int, default=288, help="readings per sensor (288 = 5-minute day)")
+    parser.add_argument("--chunk", type=int, default=250, help="shipments per streamed chunk")
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args(argv)
+
+    alerts = []
+    started = time.perf_counter()
+    total = stream_fleet(
+        lambda chunk: alerts.append(cold_chain_alerts(chunk)),
+        args.shipments, n_sensors=args.sensors, n_readings=args.readings,
+        freq_seconds=86400 // args.readings, seed=args.seed, chunk_shipments=args.chunk,
+    )
+    elapsed = time.perf_counter() - started
+    alerts = pd.concat(alerts)
+    print(f"{total:,} readings ({args.shipments} shipments x {args.sensors} sensors x {args.readings}) "
+          f"in {elapsed:.2f}s, {total / elapsed:,.0f} readings/s")
+    print(f"{len(alerts)} shipments with cold-chain excursions above {SAFE_MAX_TEMP}°C")
+
+
+if __name__ == "__main__":
+    main()
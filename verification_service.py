@@ -0,0 +1,282 @@
+"""Read-only consumer verification service.
+
+Serves the per-batch traceability reports published by step 7 of the app,
+outside the Streamlit process. Reports are keyed by their ``ReportID``, which
+is scoped to the farmer: harvest transaction hashes alone repeat across
+farms. Reports are precomputed into JSON and HTML
+bytes with a strong ETag when they are loaded, so a scan costs one dict
+lookup and, for repeat scanners, a bodiless 304.
+
+    python verification_service.py serve --port 8600
+    python verification_service.py bench --batches 1000 --requests 20000
+"""
+import argparse
+import hashlib
+import html
+import http.client
+import json
+import os
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+
+REPORT_DIR = Path(os.environ.get("TRACEABILITY_REPORT_DIR", Path(__file__).with_name("data") / "reports"))
+VERIFY_URL = os.environ.get("TRACEABILITY_VERIFY_URL", "http://localhost:8600/verify")
+
+_SAFE_ID = re.compile(r"[^A-Za-z0-9_.-]")
+
+
+def _report_path(directory, report_id):
+    return Path(directory) / f"{_SAFE_ID.sub('_', report_id)}.json"
+
+
+def _encode(report):
+    return json.dumps(report, sort_keys=True, ensure_ascii=False, separators=(",", ":")).encode()
+
+
+def publish_report(report, directory=REPORT_DIR):
+    """Write a batch report for the service to pick up; unchanged reports are not rewritten."""
+    body = _encode(report)
+    path = _report_path(directory, report["ReportID"])
+    if path.exists() and path.read_bytes() == body:
+        return path
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_suffix(".tmp")
+    tmp.write_bytes(body)
+    os.replace(tmp, path)
+    return path
+
+
+def verification_url(report_id, as_html=True):
+    # The page form is what consumers scan; the bare URL serves the JSON
+    return f"{VERIFY_URL}/{report_id}.html" if as_html else f"{VERIFY_URL}/{report_id}"
+
+
+def render_html(report):
+    e = lambda v: html.escape(str(v))
+    farmer = report.get("Farmer", {})
+    harvest = report.get("Harvest", {})
+    transport = report.get("Transport", {})
+    retailers = "".join(
+        f"<li>{e(r['Name'])}: {e(r['Quantity'])}kg</li>" for r in report.get("Retailers", [])
+    )
+    transactions = "".join(
+        f"<li><code>{e(tx)}</code></li>" for tx in report.get("Blockchain", {}).get("Transactions", [])
+    )
+    return f"""<!doctype html>
+<html><head><meta charset="utf-8"><meta name="viewport" content="width=device-width,initial-scale=1">
+<title>{e(report.get("Product", ""))} - Verified</title>
+<style>body{{font-family:sans-serif;max-width:36rem;margin:1rem auto;padding:0 1rem}}h2{{color:#4CAF50}}</style>
+</head><body>
+<h1>&#127806; {e(report.get("Product", ""))}</h1>
+<p><strong>Batch ID:</strong> {e(report.get("BatchID", ""))}</p>
+<h2>Farmer</h2>
+<p>{e(farmer.get("Name", ""))} ({e(farmer.get("ID", ""))}), {e(farmer.get("Location", ""))}</p>
+<h2>Cultivation</h2>
+<p><strong>Seed Batch:</strong> {e(report.get("Seed", ""))}</p>
+<h2>Harvest</h2>
+<p>{e(harvest.get("Date", ""))}, {e(harvest.get("Quantity", ""))}, grade {e(harvest.get("Quality", ""))}</p>
+<h2>Transport</h2>
+<p>{e(transport.get("From", ""))} to {e(transport.get("To", ""))}, {e(transport.get("Duration", ""))} at {e(transport.get("AvgTemp", ""))}</p>
+<h2>Retail Availability</h2>
+<ul>{retailers}</ul>
+<h2>Blockchain Verification</h2>
+<ul>{transactions}</ul>
+</body></html>
+""".encode()
+
+
+class CachedReport:
+    __slots__ = ("json", "html", "etag", "mtime")
+
+    def __init__(self, report, mtime=0.0):
+        self.json = _encode(report)
+        self.html = render_html(report)
+        self.etag = f'"{hashlib.sha256(self.json).hexdigest()[:32]}"'
+        self.mtime = mtime
+
+
+class ReportCache:
+    """In-memory batch reports, refreshed from the report directory by mtime."""
+
+    def __init__(self, directory=REPORT_DIR):
+        self.directory = Path(directory)
+        self._reports = {}
+        self._lock = threading.Lock()
+
+    def get(self, report_id):
+        return self._reports.get(report_id)
+
+    def put(self, report, mtime=0.0):
+        entry = CachedReport(report, mtime)
+        with self._lock:
+            self._reports[report["ReportID"]] = entry
+        return entry
+
+    def refresh(self):
+        # Rebuild only files whose mtime changed, then swap in a merged dict
+        if not self.directory.is_dir():
+            return 0
+        reports = self._reports
+        by_path = {_report_path(self.directory, report_id).name: report_id for report_id in reports}
+        updates = {}
+        for item in os.scandir(self.directory):
+            if not item.name.endswith(".json"):
+                continue
+            mtime = item.stat().st_mtime
+            known = by_path.get(item.name)
+            if known is not None and reports[known].mtime == mtime:
+                continue
+            try:
+                with open(item.path, "rb") as f:
+                    report = json.load(f)
+                report_id = report["ReportID"]
+            except (OSError, ValueError, KeyError):
+                continue
+            updates[report_id] = CachedReport(report, mtime)
+        if updates:
+            with self._lock:
+                self._reports = {**self._reports, **updates}
+        return len(updates)
+
+    def start_refresh(self, interval=5.0):
+        def loop():
+            while True:
+                time.sleep(interval)
+                self.refresh()
+        self.refresh()
+        threading.Thread(target=loop, name="report-refresh", daemon=True).start()
+
+    def __len__(self):
+        return len(self._reports)
+
+
+def _etag_matches(header, etag):
+    if header is None:
+        return False
+    if header.strip() == "*":
+        return True
+    return any(tag.strip().removeprefix("W/") == etag for tag in header.split(","))
+
+
+class VerificationHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    # Headers and body go out as separate writes; without this, Nagle plus
+    # delayed ACKs stall every keep-alive response by ~40ms
+    disable_nagle_algorithm = True
+    cache = None
+
+    def do_GET(self):
+        path = self.path.split("?", 1)[0]
+        if not path.startswith("/verify/"):
+            return self._send(404, b'{"error":"not found"}', "application/json")
+        report_id = path[len("/verify/"):]
+        as_html = report_id.endswith(".html")
+        if as_html or report_id.endswith(".json"):
+            report_id = report_id.rsplit(".", 1)[0]
+        entry = self.cache.get(report_id)
+        if entry is None:
+            return self._send(404, b'{"error":"unknown report"}', "application/json")
+        if _etag_matches(self.headers.get("If-None-Match"), entry.etag):
+            return self._send(304, b"", None, entry.etag)
+        if as_html:
+            return self._send(200, entry.html, "text/html; charset=utf-8", entry.etag)
+        return self._send(200, entry.json, "application/json", entry.etag)
+
+    def _send(self, status, body, content_type, etag=None):
+        self.send_response(status)
+        if etag is not None:
+            self.send_header("ETag", etag)
+            self.send_header("Cache-Control", "public, max-age=60")
+        if content_type is not None:
+            self.send_header("Content-Type", content_type)
+        if status != 304:
+            self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        if body:
+            self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def make_server(cache, host="127.0.0.1", port=8600):
+    handler = type("BoundVerificationHandler", (VerificationHandler,), {"cache": cache})
+    return ThreadingHTTPServer((host, port), handler)
+
+
+def _sample_report(i):
+    batch_id = f"0x{hashlib.sha256(str(i).encode()).hexdigest()[:20]}"
+    farmer_id = f"FARM{1000 + i % 9000}"
+    return {
+        "ReportID": f"{farmer_id}-{batch_id}",
+        "Product": "Sharbati Wheat",
+        "BatchID": batch_id,
+        "Farmer": {"Name": "Vijay Aswal", "ID": farmer_id, "Location": "Harsill"},
+        "Seed": f"SEED{1000 + i % 9000}",
+        "Harvest": {"Date": "2026-10-19", "Quantity": "500kg", "Quality": "A"},
+        "Transport": {"From": "Harsill", "To": "Mumbai", "Duration": "24 hours", "AvgTemp": "3.9°C"},
+        "Retailers": [{"Name": "FreshMart", "Quantity": 200}, {"Name": "Organic Bazaar", "Quantity": 300}],
+        "Blockchain": {"Transactions": [f"0x{hashlib.sha256(f'{i}-{k}'.encode()).hexdigest()[:20]}" for k in range(7)]},
+    }
+
+
+def bench(batches, requests):
+    cache = ReportCache()
+    ids = []
+    for i in range(batches):
+        report = _sample_report(i)
+        cache.put(report)
+        ids.append(report["ReportID"])
+
+    started = time.perf_counter()
+    for n in range(requests):
+        entry = cache.get(ids[n % batches])
+        _etag_matches(entry.etag, entry.etag)
+    lookup_rate = requests / (time.perf_counter() - started)
+    print(f"in-process lookups: {lookup_rate:,.0f}/s")
+
+    server = make_server(cache, port=0)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    conn = http.client.HTTPConnection("127.0.0.1", server.server_address[1])
+    for label, revalidate in (("200 JSON", False), ("304 revalidated", True)):
+        started = time.perf_counter()
+        for n in range(requests):
+            report_id = ids[n % batches]
+            headers = {"If-None-Match": cache.get(report_id).etag} if revalidate else {}
+            conn.request("GET", f"/verify/{report_id}", headers=headers)
+            response = conn.getresponse()
+            response.read()
+        rate = requests / (time.perf_counter() - started)
+        print(f"HTTP keep-alive, one client ({label}): {rate:,.0f} requests/s")
+    conn.close()
+    server.shutdown()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Consumer verification service")
+    sub = parser.add_subparsers(dest="command", required=True)
+    serve = sub.add_parser("serve", help="serve published reports")
+    serve.add_argument("--host", default="127.0.0.1")
+    serve.add_argument("--port", type=int, default=8600)
+    serve.add_argument("--reports", default=str(REPORT_DIR), help="report directory written by the app")
+    serve.add_argument("--refresh", type=float, default=5.0, help="seconds between directory rescans")
+    benchmark = sub.add_parser("bench", help="measure lookup throughput")
+    benchmark.add_argument("--batches", type=int, default=1000)
+    benchmark.add_argument("--requests", type=int, default=20000)
+    args = parser.parse_args(argv)
+
+    if args.command == "bench":
+        bench(args.batches, args.requests)
+        return
+    cache = ReportCache(args.reports)
+    cache.start_refresh(args.refresh)
+    server = make_server(cache, args.host, args.port)
+    print(f"Serving {len(cache)} reports on http://{args.host}:{args.port}/verify/<report_id>")
+    server.serve_forever()
+
+
+if __name__ == "__main__":
+    main()